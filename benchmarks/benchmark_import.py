@@ -0,0 +1,83 @@
+"""
+Benchmark the time it takes to import the lasso plugin.
+
+The plugin modules are imported in fresh interpreters, after the napari
+modules that are loaded anyway when napari runs, so only the cost added by
+the plugin is measured. Heavy optional modules that got imported are listed
+as well. With --max-seconds, the script fails if the median import time
+exceeds the limit, so it can guard against regressions.
+
+Usage:
+    python benchmarks/benchmark_import.py
+    python benchmarks/benchmark_import.py --repeats 10 --max-seconds 0.5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+MODULES = ("lasso_3d._widget", "lasso_3d.lasso_batch")
+HEAVY_MODULES = ("membrain_seg", "torch", "dask.array")
+PRELOADED = "import napari.layers, napari.qt.threading, magicgui"
+
+MEASURE = """
+import json, sys, time
+{preloaded}
+start = time.perf_counter()
+import {module}
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "heavy_modules": [m for m in {heavy} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import(module, preloaded=PRELOADED):
+    """
+    Import a module in a fresh interpreter and return the import time (s)
+    and the heavy modules it loaded.
+    """
+    code = MEASURE.format(
+        preloaded=preloaded, module=module, heavy=HEAVY_MODULES
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["seconds"], result["heavy_modules"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="Fail if the median import time of a module exceeds this.",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        times = []
+        for _ in range(args.repeats):
+            seconds, heavy_modules = measure_import(module)
+            times.append(seconds)
+        median = float(np.median(times))
+        print(
+            f"benchmark=import, module={module}, median_s={median:.3f}, "
+            f"min_s={min(times):.3f}, heavy_modules={heavy_modules}"
+        )
+        if args.max_seconds is not None and median > args.max_seconds:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Benchmarks for the lasso mask engines and the connected component steps.
+
+Every mask engine registered in lasso_3d.lasso_engines.MASK_ENGINES is timed
+for a sweep of tomogram sizes, polygon vertex counts and normal orientations.
+For each run, the wall time, the peak memory allocated by numpy (traced with
+tracemalloc) and the voxel agreement (IoU) with the reference engine are
+reported. Polygons are generated with fixed seeds, so results are
+reproducible.
+
+With --max-seconds and --max-mb, the script fails if a run exceeds its
+budget, so it can guard against regressions. A budget is given as LIMIT
+(all runs), NAME=LIMIT or NAME@SIZE=LIMIT, where NAME is an engine or one
+of the component benchmarks; the most specific budget of a run applies.
+
+Usage:
+    python benchmarks/benchmark_lasso.py
+    python benchmarks/benchmark_lasso.py --sizes 128 256 --output results.json
+    python benchmarks/benchmark_lasso.py --max-seconds 5 projection@256=1
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+from lasso_3d.lasso_components import connected_components
+from lasso_3d.lasso_engines import MASK_ENGINES
+from lasso_3d.lasso_io import store_components
+from lasso_3d.lasso_utils import (
+    generate_example_polygon,
+    generate_random_polygon,
+)
+
+REFERENCE_ENGINE = "projection"
+ORIENTATIONS = ("axis", "oblique")
+
+
+def measure(func, *args, **kwargs):
+    """
+    Run func and return its result, the wall time (s) and peak memory (MB).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    wall_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, wall_time, peak / 2**20
+
+
+def make_polygon(tomo_size, n_vertices, orientation, seed):
+    """
+    Create a reproducible polygon for a cubic tomogram of size tomo_size.
+
+    "axis" polygons lie in a plane normal to the first axis, "oblique"
+    polygons are rotated randomly around their center.
+    """
+    np.random.seed(seed)
+    if n_vertices is None:
+        polygon_3d = generate_example_polygon(
+            random_rotation=orientation == "oblique"
+        )
+        return polygon_3d * tomo_size / 100
+    polygon_3d = generate_random_polygon(n_vertices, (tomo_size,) * 3)
+    if orientation == "axis":
+        polygon_3d[:, 0] = tomo_size // 2
+    return polygon_3d
+
+
+def iou(mask_a, mask_b):
+    union = np.count_nonzero(mask_a | mask_b)
+    if union == 0:
+        return 1.0
+    return np.count_nonzero(mask_a & mask_b) / union
+
+
+def benchmark_engines(sizes, vertex_counts, seed):
+    results = []
+    for tomo_size in sizes:
+        tomo_shape = (tomo_size,) * 3
+        for n_vertices in vertex_counts:
+            for orientation in ORIENTATIONS:
+                polygon_3d = make_polygon(
+                    tomo_size, n_vertices, orientation, seed
+                )
+                reference = None
+                for engine, engine_func in MASK_ENGINES.items():
+                    mask, wall_time, peak = measure(
+                        engine_func, polygon_3d.copy(), tomo_shape
+                    )
+                    if engine == REFERENCE_ENGINE:
+                        reference = mask
+                    results.append(
+                        {
+                            "benchmark": "mask",
+                            "engine": engine,
+                            "tomo_size": tomo_size,
+                            "n_vertices": n_vertices or "example",
+                            "orientation": orientation,
+                            "wall_time_s": wall_time,
+                            "peak_memory_mb": peak,
+                            "mask": mask,
+                        }
+                    )
+                for result in results:
+                    if "mask" in result:
+                        result["iou"] = iou(result.pop("mask"), reference)
+    return results
+
+
+def benchmark_components(sizes, seed):
+    results = []
+    rng = np.random.default_rng(seed)
+    for tomo_size in sizes:
+        # smooth noise gives blob-like components of various sizes
+        mask = gaussian_filter(rng.random((tomo_size,) * 3), 2) > 0.52
+        for perform_opening in (False, True):
+            (components, _), wall_time, peak = measure(
+                connected_components, mask, 10, perform_opening
+            )
+            results.append(
+                {
+                    "benchmark": "connected_components",
+                    "tomo_size": tomo_size,
+                    "perform_opening": perform_opening,
+                    "wall_time_s": wall_time,
+                    "peak_memory_mb": peak,
+                }
+            )
+        for cropped in (True, False):
+            with tempfile.TemporaryDirectory() as foldername:
+                _, wall_time, peak = measure(
+                    store_components,
+                    components,
+                    foldername,
+                    cropped=cropped,
+                )
+            results.append(
+                {
+                    "benchmark": "store_components",
+                    "tomo_size": tomo_size,
+                    "n_components": int(components.max()),
+                    "cropped": cropped,
+                    "wall_time_s": wall_time,
+                    "peak_memory_mb": peak,
+                }
+            )
+    return results
+
+
+def parse_budget(text):
+    """
+    Parse a budget "[NAME[@SIZE]=]LIMIT" into ((name, size), limit), where
+    name and size are None if not given.
+    """
+    target, _, limit = text.rpartition("=")
+    name, _, size = target.partition("@")
+    try:
+        return (name or None, int(size) if size else None), float(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid budget {text!r}, expected [NAME[@SIZE]=]LIMIT"
+        ) from None
+
+
+def exceeded_budgets(results, budgets, key):
+    """
+    Results whose value of key exceeds their most specific budget, together
+    with the budget.
+    """
+    budgets = dict(budgets)
+    exceeded = []
+    for result in results:
+        name = result.get("engine", result["benchmark"])
+        size = result["tomo_size"]
+        for target in ((name, size), (name, None), (None, size), (None, None)):
+            if target in budgets:
+                if result[key] > budgets[target]:
+                    exceeded.append((result, budgets[target]))
+                break
+    return exceeded
+
+
+def format_result(result):
+    return ", ".join(
+        f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+        for key, value in result.items()
+    )
+
+
+def print_results(results):
+    for result in results:
+        print(format_result(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument(
+        "--vertices",
+        type=int,
+        nargs="+",
+        default=[5, 20, 100],
+        help="Vertex counts of random polygons (the example polygon is "
+        "always included).",
+    )
+    parser.add_argument(
+        "--component-sizes",
+        type=int,
+        nargs="+",
+        default=[64, 128],
+        help="Tomogram sizes for the connected component benchmarks.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Store the results as JSON file.")
+    parser.add_argument(
+        "--max-seconds",
+        type=parse_budget,
+        nargs="+",
+        default=[],
+        help="Fail if the wall time of a run exceeds its budget.",
+    )
+    parser.add_argument(
+        "--max-mb",
+        type=parse_budget,
+        nargs="+",
+        default=[],
+        help="Fail if the peak memory of a run exceeds its budget.",
+    )
+    args = parser.parse_args()
+
+    results = benchmark_engines(args.sizes, [None] + args.vertices, args.seed)
+    results += benchmark_components(args.component_sizes, args.seed)
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    for key, budgets in (
+        ("wall_time_s", args.max_seconds),
+        ("peak_memory_mb", args.max_mb),
+    ):
+        for result, budget in exceeded_budgets(results, budgets, key):
+            print(f"EXCEEDED {key} budget {budget}: {format_result(result)}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
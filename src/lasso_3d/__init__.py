@@ -1,7 +1,13 @@
 __version__ = "0.0.1"
 
-from ._widget import (
-    Lasso3D,
-)
-
 __all__ = ("Lasso3D",)
+
+
+def __getattr__(name):
+    # the widget needs napari and Qt; importing it lazily keeps the lasso
+    # functions (e.g. lasso_3d.lasso_batch) usable without a GUI
+    if name == "Lasso3D":
+        from ._widget import Lasso3D
+
+        return Lasso3D
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,104 @@
+import numpy as np
+from qtpy.QtCore import QAbstractTableModel, Qt
+
+COMPONENT_TABLE_COLUMNS = [
+    "Label",
+    "Voxels",
+    "Bounding box",
+    "Centroid (z, y, x)",
+    "Mean intensity",
+]
+
+
+class ComponentTableModel(QAbstractTableModel):
+    """
+    Read-only view of a component table (see component_table).
+
+    Cells are formatted from the arrays of the table when they are shown,
+    so tables with many components are displayed without copying them.
+    Sorting only permutes the row order.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._table = None
+        self._order = np.empty(0, dtype=np.intp)
+
+    def set_table(self, table):
+        """
+        Show another component table (or none).
+        """
+        self.beginResetModel()
+        self._table = table
+        num_rows = 0 if table is None else len(table["label"])
+        self._order = np.arange(num_rows)
+        self.endResetModel()
+
+    def label(self, row):
+        """
+        Label of the component shown in a row.
+        """
+        return int(self._table["label"][self._order[row]])
+
+    def rowCount(self, parent=None):
+        # a table has no children below its rows
+        if parent is not None and parent.isValid():
+            return 0
+        return len(self._order)
+
+    def columnCount(self, parent=None):
+        if parent is not None and parent.isValid():
+            return 0
+        return len(COMPONENT_TABLE_COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return COMPONENT_TABLE_COLUMNS[section]
+        return section + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        table = self._table
+        row = self._order[index.row()]
+        column = index.column()
+        if column == 0:
+            return int(table["label"][row])
+        if column == 1:
+            return int(table["size"][row])
+        if column == 2:
+            return ", ".join(
+                f"{a}:{b}"
+                for a, b in zip(
+                    table["bbox_start"][row], table["bbox_stop"][row]
+                )
+            )
+        if column == 3:
+            return str(table["centroid"][row].round(1).tolist())
+        if table["mean_intensity"] is None:
+            return None
+        return float(table["mean_intensity"][row])
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if self._table is None:
+            return
+        table = self._table
+        if column == 0:
+            rows = np.argsort(table["label"], kind="stable")
+        elif column == 1:
+            rows = np.argsort(table["size"], kind="stable")
+        elif column == 2:
+            rows = np.lexsort(table["bbox_start"].T[::-1])
+        elif column == 3:
+            rows = np.lexsort(table["centroid"].T[::-1])
+        elif table["mean_intensity"] is not None:
+            rows = np.argsort(table["mean_intensity"], kind="stable")
+        else:
+            return
+        if order == Qt.DescendingOrder:
+            rows = rows[::-1]
+        self.layoutAboutToBeChanged.emit()
+        self._order = rows
+        self.layoutChanged.emit()
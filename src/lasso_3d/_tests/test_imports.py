@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+import lasso_3d
+
+# modules that must not be loaded just by opening the plugin
+HEAVY_MODULES = ("membrain_seg", "torch", "dask.array")
+
+
+def test_plugin_import_is_lightweight():
+    # import the same lasso_3d package in a fresh interpreter
+    package_dir = os.path.dirname(os.path.dirname(lasso_3d.__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, (package_dir, env.get("PYTHONPATH")))
+    )
+    code = (
+        "import sys, lasso_3d._widget; "
+        f"print([m for m in {HEAVY_MODULES} if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    ).stdout
+    assert output.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,46 @@
+import json
+import os
+
+import mrcfile
+import numpy as np
+
+from lasso_3d.lasso_batch import load_polygons, main
+from lasso_3d.lasso_utils import generate_example_polygon
+
+
+def test_load_polygons(tmp_path):
+    polygons = [generate_example_polygon(), generate_example_polygon() + 1]
+    json_file = tmp_path / "polygons.json"
+    json_file.write_text(json.dumps([p.tolist() for p in polygons]))
+    csv_file = tmp_path / "polygons.csv"
+    rows = ["polygon,z,y,x"] + [
+        ",".join(map(str, (idx, *vertex)))
+        for idx, polygon in enumerate(polygons)
+        for vertex in polygon
+    ]
+    csv_file.write_text("\n".join(rows))
+
+    for filename in (json_file, csv_file):
+        loaded = load_polygons(str(filename))
+        assert len(loaded) == 2
+        assert np.allclose(loaded[1], polygons[1])
+
+
+def test_batch_cli(tmp_path):
+    tomogram_dir = tmp_path / "tomograms"
+    tomogram_dir.mkdir()
+    volume = np.zeros((100, 100, 100), dtype=np.float32)
+    volume[30:40, 18:28, 20:30] = 1
+    volume[60:70, 10:20, 80:90] = 1
+    mrcfile.write(str(tomogram_dir / "tomo.mrc"), volume)
+    polygons_file = tmp_path / "polygons.json"
+    polygons_file.write_text(json.dumps([generate_example_polygon().tolist()]))
+
+    output_dir = tmp_path / "output"
+    argv = [str(polygons_file), str(tomogram_dir), str(output_dir)]
+    assert main(argv + ["--cropped", "--remove-small-objects-size", "0"]) == 0
+    assert sorted(os.listdir(output_dir / "tomo")) == [
+        "component_1.mrc",
+        "components.csv",
+        "mask.mrc",
+    ]
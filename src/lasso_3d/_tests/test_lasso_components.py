@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+from scipy.ndimage import (
+    binary_closing,
+    binary_dilation,
+    binary_erosion,
+    center_of_mass,
+    find_objects,
+    gaussian_filter,
+    generate_binary_structure,
+    label,
+)
+
+from lasso_3d.lasso_components import (
+    component_table,
+    remove_components,
+    remove_small_components,
+)
+from lasso_3d.lasso_labelling import label_in_chunks
+from lasso_3d.lasso_morphology import STRUCTURE, closing, opening
+
+
+def test_remove_small_components():
+    components = np.zeros((10, 10, 10), dtype=np.int32)
+    components[0, 0, :5] = 1
+    components[2, 2, :1] = 2
+    components[4, 4, :3] = 3
+    components[6, 6, :1] = 4
+
+    relabeled, sizes = remove_small_components(components, 2)
+
+    expected = np.zeros_like(components)
+    expected[0, 0, :5] = 1
+    expected[4, 4, :3] = 2
+    assert relabeled.dtype == np.uint8
+    assert np.array_equal(relabeled, expected)
+    assert np.array_equal(sizes, [992, 5, 3])
+
+
+def test_bbox_morphology_matches_full_volume():
+    rng = np.random.default_rng(0)
+    mask = gaussian_filter(rng.random((40, 30, 35)), 1.5) > 0.53
+    mask[:5] = False
+
+    assert np.array_equal(
+        closing(mask, slab_size=7), binary_closing(mask, STRUCTURE)
+    )
+    # border handling of skimage.morphology.binary_opening
+    eroded = binary_erosion(mask, STRUCTURE, border_value=1)
+    assert np.array_equal(
+        opening(mask, slab_size=7), binary_dilation(eroded, STRUCTURE)
+    )
+    assert not opening(np.zeros((5, 5, 5), dtype=bool)).any()
+
+
+def test_label_in_chunks_matches_scipy(monkeypatch):
+    # chunks are only labelled separately with several CPUs
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+    rng = np.random.default_rng(0)
+    # negative values, like those of a masked volume, are background
+    volume = gaussian_filter(rng.random((40, 30, 35)), 1.2) - 0.52
+    mask = volume > 0
+
+    for connectivity, rank in ((6, 1), (18, 2), (26, 3)):
+        expected, num_expected = label(
+            mask, generate_binary_structure(3, rank)
+        )
+        for chunk_size, n_workers in ((1, 4), (7, 4), (7, 1)):
+            for data in (mask, volume):
+                labels, num_labels = label_in_chunks(
+                    data,
+                    connectivity,
+                    chunk_size=chunk_size,
+                    n_workers=n_workers,
+                )
+                assert num_labels == num_expected
+                assert np.array_equal(labels, expected)
+
+
+def test_component_table():
+    rng = np.random.default_rng(1)
+    intensities = rng.random((30, 20, 25))
+    components, num_labels = label(gaussian_filter(intensities, 1) > 0.52)
+
+    table = component_table(components, intensities, max_block_voxels=1000)
+
+    labels = np.arange(1, num_labels + 1)
+    assert np.array_equal(table["label"], labels)
+    assert np.array_equal(table["size"], np.bincount(components.ravel())[1:])
+    assert np.allclose(
+        table["centroid"], center_of_mass(components > 0, components, labels)
+    )
+    assert np.allclose(
+        table["mean_intensity"],
+        [intensities[components == label].mean() for label in labels],
+    )
+    assert [
+        tuple(slice(a, b) for a, b in zip(start, stop))
+        for start, stop in zip(table["bbox_start"], table["bbox_stop"])
+    ] == find_objects(components)
+
+    table = remove_components(components, table, [2, 3])
+    assert not np.isin(components, [2, 3]).any()
+    assert np.array_equal(table["label"], np.delete(labels, [1, 2]))
@@ -0,0 +1,289 @@
+import dask.array as da
+import numpy as np
+import pytest
+from scipy.ndimage import binary_fill_holes
+from skimage.measure import points_in_poly
+
+from lasso_3d import lasso_chunked
+from lasso_3d.lasso_add_slices import mask_via_extension
+from lasso_3d.lasso_cache import MaskCache
+from lasso_3d.lasso_composite import composite_masks
+from lasso_3d.lasso_engines import MASK_ENGINES, generate_mask, preview_mask
+from lasso_3d.lasso_incremental import recompute_changed_region
+from lasso_3d.lasso_masking import mask_volume
+from lasso_3d.lasso_projection import mask_via_projection
+from lasso_3d.lasso_rotate_vol import extend_polygon_to_3D_mask_voxels
+from lasso_3d.lasso_utils import (
+    expand_to_full,
+    generate_example_polygon,
+    generate_random_polygon,
+    roll_or_concat,
+    rotate_polygon_to_xy_plane,
+    shift_into,
+    simplify_polygon,
+)
+
+
+def exact_prism(polygon_3d, tomo_shape):
+    """
+    Voxels whose centers lie inside the polygon extruded along its normal,
+    and the in-plane distance of every voxel center to the polygon outline.
+    """
+    polygon_3d = np.asarray(polygon_3d, dtype=float)
+    _, _, rot_mat = rotate_polygon_to_xy_plane(polygon_3d.copy())
+    polygon_2d = np.dot(polygon_3d, rot_mat[:2].T)
+    points = np.dot(np.indices(tomo_shape).reshape(3, -1).T, rot_mat[:2].T)
+    inside = points_in_poly(points, polygon_2d).reshape(tomo_shape)
+
+    distance = np.full(len(points), np.inf)
+    for a, b in zip(polygon_2d, np.roll(polygon_2d, -1, axis=0)):
+        t = np.clip(np.dot(points - a, b - a) / np.dot(b - a, b - a), 0, 1)
+        segment_distance = np.linalg.norm(
+            points - a - t[:, None] * (b - a), axis=1
+        )
+        np.minimum(distance, segment_distance, out=distance)
+    return inside, distance.reshape(tomo_shape)
+
+
+def test_projection_matches_exact_prism():
+    tomo_shape = (80, 80, 80)
+    np.random.seed(3)
+    polygons = [generate_example_polygon() * 0.8] + [
+        generate_random_polygon(8, tomo_shape) for _ in range(3)
+    ]
+    for polygon_3d in polygons:
+        mask = mask_via_projection(polygon_3d, tomo_shape)
+        inside, distance = exact_prism(polygon_3d, tomo_shape)
+
+        assert mask.shape == tomo_shape
+        assert mask.dtype == bool
+        # voxels only differ if their centers are within the rounding error
+        # of the 2D mask (a quarter voxel) from the outline
+        assert np.all(distance[mask != inside] < 0.25)
+
+
+def test_projection_matches_extension():
+    polygon_3d = generate_example_polygon()
+    tomo_shape = (100, 100, 100)
+
+    mask_projection = mask_via_projection(polygon_3d, tomo_shape)
+    mask_extension = mask_via_extension(polygon_3d, tomo_shape)
+
+    intersection = np.sum(mask_projection & mask_extension)
+    union = np.sum(mask_projection | mask_extension)
+    assert intersection / union > 0.85
+
+
+def test_rotation_matches_projection():
+    np.random.seed(0)
+    polygon_3d = generate_example_polygon(random_rotation=True)
+    tomo_shape = (100, 100, 100)
+
+    mask_projection = mask_via_projection(polygon_3d, tomo_shape)
+    mask_rotation = extend_polygon_to_3D_mask_voxels(polygon_3d, tomo_shape)
+
+    assert mask_rotation.shape == tomo_shape
+    assert mask_rotation.dtype == bool
+    intersection = np.sum(mask_projection & mask_rotation)
+    union = np.sum(mask_projection | mask_rotation)
+    assert intersection / union > 0.9
+
+
+def test_supercover_needs_no_closing():
+    np.random.seed(1)
+    polygon_3d = generate_example_polygon(random_rotation=True)
+    tomo_shape = (100, 100, 100)
+
+    mask = mask_via_extension(polygon_3d, tomo_shape, conservative=True)
+    mask_projection = mask_via_projection(polygon_3d, tomo_shape)
+
+    assert not (binary_fill_holes(mask) & ~mask).any()
+    assert np.sum(mask_projection & ~mask) < 0.001 * np.sum(mask_projection)
+
+
+def test_supercover_is_conservative():
+    tomo_shape = (50, 50, 50)
+    np.random.seed(8)
+    for num_vertices in (4, 6, 8, 10, 12):
+        polygon_3d = generate_random_polygon(num_vertices, tomo_shape)
+        mask = mask_via_extension(polygon_3d, tomo_shape, conservative=True)
+        inside, distance = exact_prism(polygon_3d, tomo_shape)
+
+        # voxels inside are only missed close to the rasterized outline,
+        # marked voxels outside lie within the margin of the supercover
+        assert np.all(distance[inside & ~mask] < 0.5)
+        assert np.all(distance[mask & ~inside] < np.sqrt(3))
+
+
+def test_empty_mask_warns():
+    # lasso outside of the volume
+    polygon = np.array(
+        [(5, 30, 30), (5, 30, 40), (5, 40, 40), (5, 40, 30)], dtype=float
+    )
+    for engine in MASK_ENGINES:
+        with pytest.warns(UserWarning, match="No mask created"):
+            mask = generate_mask(polygon, (20, 20, 20), engine=engine)
+        assert not mask.any()
+
+
+def test_projection_is_extruded_along_normal():
+    # polygon in a plane of constant first coordinate
+    polygon_3d = generate_example_polygon()
+    mask = mask_via_projection(polygon_3d, (100, 100, 100))
+
+    assert mask.any()
+    assert (mask == mask[:1]).all()
+
+
+def test_cropped_mask_matches_full_mask():
+    np.random.seed(0)
+    polygon_3d = generate_example_polygon(random_rotation=True)
+    tomo_shape = (100, 100, 100)
+
+    for engine in (
+        mask_via_extension,
+        mask_via_projection,
+        extend_polygon_to_3D_mask_voxels,
+    ):
+        mask = engine(polygon_3d, tomo_shape)
+        mask_cropped, offset = engine(polygon_3d, tomo_shape, crop=True)
+
+        assert np.all(mask_cropped.shape <= np.array(tomo_shape))
+        assert np.array_equal(
+            expand_to_full(mask_cropped, offset, tomo_shape), mask
+        )
+
+
+def test_composite_masks():
+    polygon_3d = generate_example_polygon()
+    polygon_3d_shifted = polygon_3d.copy()
+    polygon_3d_shifted[:, 1] += 10
+    tomo_shape = (100, 100, 100)
+    mask = mask_via_projection(polygon_3d, tomo_shape)
+    mask_shifted = mask_via_projection(polygon_3d_shifted, tomo_shape)
+
+    for operation, expected in (
+        ("union", mask | mask_shifted),
+        ("intersect", mask & mask_shifted),
+        ("subtract", mask & ~mask_shifted),
+    ):
+        composite = composite_masks(
+            [polygon_3d, polygon_3d_shifted],
+            ["union", operation],
+            tomo_shape,
+        )
+        assert np.array_equal(composite, expected)
+
+
+def test_mask_cache():
+    polygon_3d = generate_example_polygon()
+    tomo_shape = (100, 100, 100)
+    cache = MaskCache()
+
+    mask = generate_mask(polygon_3d, tomo_shape, cache=cache)
+    assert len(cache) == 1
+    assert np.array_equal(
+        generate_mask(polygon_3d, tomo_shape, cache=cache), mask
+    )
+    assert len(cache) == 1
+
+    cache.resize(cache.nbytes - 1)
+    assert len(cache) == 0
+
+
+def test_shift_into():
+    volume = np.arange(24, dtype=np.uint8).reshape(2, 3, 4)
+
+    shifted = shift_into(volume, (0, 1, -2))
+    assert shifted.dtype == np.uint8
+    assert np.array_equal(shifted[:, 1:, :2], volume[:, :2, 2:])
+    assert not shifted[:, :1].any() and not shifted[:, :, 2:].any()
+
+    rolled = roll_or_concat(volume, -1, 1)
+    assert np.array_equal(rolled[:, :2], volume[:, 1:])
+    assert not rolled[:, 2].any()
+
+    out = np.ones((4, 4, 4), dtype=np.uint8)
+    shift_into(volume, (3, 0, 0), out=out)
+    assert np.array_equal(out[3, :3], volume[0])
+    assert (out[:3] == 1).all()
+
+
+def test_simplify_polygon():
+    # densely sampled square in a plane of constant first coordinate
+    t = np.linspace(0, 1, 50, endpoint=False)[:, np.newaxis]
+    corners = np.array([[0, 0], [0, 40], [40, 40], [40, 0], [0, 0]])
+    outline = np.concatenate(
+        [start + t * (end - start) for start, end in zip(corners, corners[1:])]
+    )
+    polygon = np.insert(outline, 0, 10, axis=1)
+    polygon[1::2, 1] += 0.2
+
+    simplified = simplify_polygon(polygon, tolerance=1.0)
+    assert simplified.shape == (4, 3)
+    assert np.array_equal(simplified[:, 1:], corners[:4])
+    assert simplify_polygon(polygon, tolerance=0) is polygon
+
+
+def test_preview_mask_matches_binned_mask():
+    polygon = generate_example_polygon()
+    mask = generate_mask(polygon, (100, 100, 100))
+    binned = mask.reshape(25, 4, 25, 4, 25, 4).mean(axis=(1, 3, 5)) > 0.5
+
+    preview = preview_mask(polygon, (100, 100, 100), binning=4)
+    assert preview.shape == (25, 25, 25)
+    assert np.count_nonzero(preview != binned) < 0.1 * binned.sum()
+
+
+def test_lazy_mask_matches_mask(monkeypatch):
+    np.random.seed(0)
+    polygon = generate_example_polygon(random_rotation=True)
+    volume = np.random.rand(100, 100, 100).astype(np.float32)
+    image = da.from_array(volume, chunks=20)
+
+    # count the blocks for which voxels are projected
+    projected_blocks = []
+    project_region = lasso_chunked.project_region
+
+    def counting_project_region(*args, **kwargs):
+        projected_blocks.append(args[3])
+        return project_region(*args, **kwargs)
+
+    monkeypatch.setattr(
+        lasso_chunked, "project_region", counting_project_region
+    )
+    lazy_mask = lasso_chunked.lazy_mask_via_projection(
+        polygon, volume.shape, chunks=image.chunks
+    )
+    mask = generate_mask(polygon, volume.shape)
+    assert np.array_equal(lazy_mask.compute(), mask)
+    # blocks outside the prism are zero blocks without projection
+    assert 0 < len(projected_blocks) < np.prod(lazy_mask.numblocks)
+
+    for masking in ("isolate", "subtract"):
+        masked = lasso_chunked.lazy_mask_volume(image, lazy_mask, masking)
+        assert np.array_equal(
+            masked.compute(), mask_volume(volume, mask, masking)
+        )
+
+
+def test_recompute_changed_region():
+    polygon = generate_example_polygon()
+    tomo_shape = (100, 100, 100)
+    old_mask = generate_mask(polygon, tomo_shape)
+
+    # move a vertex within the plane of the polygon and out of it
+    for shift in ([0, 4, -3], [5, 0, 0]):
+        new_polygon = polygon.copy()
+        new_polygon[2] += shift
+        region, patch = recompute_changed_region(
+            polygon, new_polygon, tomo_shape
+        )
+        mask = old_mask.copy()
+        mask[region] = patch
+        assert np.array_equal(mask, generate_mask(new_polygon, tomo_shape))
+        if shift[0] == 0:
+            # a local edit only recomputes a part of the volume
+            assert patch.size < 0.1 * old_mask.size
+
+    assert recompute_changed_region(polygon, polygon, tomo_shape) is None
@@ -0,0 +1,65 @@
+import numpy as np
+
+from lasso_3d.lasso_components import connected_components
+from lasso_3d.lasso_masking import mask_bounding_box, mask_volume
+from lasso_3d.lasso_packed import PackedMask
+
+
+def test_packed_mask_matches_dense():
+    rng = np.random.default_rng(0)
+    mask_a = rng.random((7, 9, 13)) > 0.6
+    mask_b = rng.random((7, 9, 13)) > 0.5
+    packed_a = PackedMask.from_dense(mask_a)
+    packed_b = PackedMask.from_dense(mask_b)
+
+    assert packed_a.dtype == bool
+    assert packed_a.nbytes < mask_a.nbytes
+    assert np.array_equal(np.asarray(packed_a | packed_b), mask_a | mask_b)
+    assert np.array_equal(np.asarray(packed_a & packed_b), mask_a & mask_b)
+    assert np.array_equal(np.asarray(~packed_a), ~mask_a)
+    assert (~packed_a).count_nonzero() == np.count_nonzero(~mask_a)
+    for key in (3, (slice(1, 4), 2), (..., 5), (2, slice(None), slice(3, 9))):
+        assert np.array_equal(packed_a[key], mask_a[key])
+
+    copy = packed_a.copy()
+    packed_a[1:3, 2:5, 4:11] = True
+    assert np.array_equal(np.asarray(copy), mask_a)
+    mask_a[1:3, 2:5, 4:11] = True
+    assert np.array_equal(np.asarray(packed_a), mask_a)
+
+
+def test_connected_components_of_packed_mask():
+    mask = np.zeros((30, 30, 30), dtype=bool)
+    mask[5:10, 5:10, 5:10] = True
+    mask[5:10, 5:10, 10] = True
+    mask[20:25, 12:20, 3:8] = True
+
+    for perform_opening in (False, True):
+        components, sizes = connected_components(mask, 2, perform_opening)
+        components_packed, sizes_packed = connected_components(
+            PackedMask.from_dense(mask), 2, perform_opening
+        )
+        assert np.array_equal(components_packed, components)
+        assert np.array_equal(sizes_packed, sizes)
+
+
+def test_mask_volume_modes():
+    rng = np.random.default_rng(0)
+    volume = rng.random((20, 30, 40)).astype(np.float32)
+    mask = np.zeros(volume.shape, dtype=bool)
+    mask[3:9, 5:25, 10:12] = rng.random((6, 20, 2)) > 0.3
+
+    assert np.array_equal(mask_bounding_box(mask)[0], [3, 5, 10])
+    for masking, expected in (
+        ("isolate", np.where(mask, volume, 0)),
+        ("subtract", np.where(mask, 0, volume)),
+    ):
+        for packed in (False, True):
+            mask_input = PackedMask.from_dense(mask) if packed else mask
+            masked = mask_volume(
+                volume, mask_input, masking, max_block_voxels=2**8
+            )
+            assert np.array_equal(masked, expected)
+            volume_copy = volume.copy()
+            mask_volume(volume_copy, mask_input, masking, in_place=True)
+            assert np.array_equal(volume_copy, expected)
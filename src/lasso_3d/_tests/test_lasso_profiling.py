@@ -0,0 +1,72 @@
+import json
+import threading
+import tracemalloc
+
+import numpy as np
+
+from lasso_3d import lasso_profiling
+from lasso_3d.lasso_engines import generate_mask
+from lasso_3d.lasso_utils import generate_example_polygon
+
+
+def test_stage_records(tmp_path, monkeypatch):
+    monkeypatch.setitem(lasso_profiling._settings, "enabled", False)
+    monkeypatch.setitem(lasso_profiling._settings, "trace_file", None)
+    with lasso_profiling.stage("Disabled") as records:
+        pass
+    assert records == []
+
+    trace_file = tmp_path / "trace.jsonl"
+    lasso_profiling.enable(trace_file)
+    try:
+        with lasso_profiling.stage("Lasso") as records:
+            generate_mask(
+                generate_example_polygon(), (100, 100, 100), "extension"
+            )
+    finally:
+        lasso_profiling.disable()
+
+    stages = [(record["depth"], record["stage"]) for record in records]
+    assert stages[:3] == [
+        (0, "Lasso"),
+        (1, "Mask (extension)"),
+        (2, "Rotating polygon"),
+    ]
+    assert (2, "Closing holes") in stages
+    # the full mask of 1e6 bytes is allocated within the outermost stage
+    assert records[0]["peak_mb"] >= 1e6 / 2**20
+    assert all(record["seconds"] >= 0 for record in records)
+    (line,) = trace_file.read_text().splitlines()
+    assert json.loads(line)["records"] == records
+
+
+def test_concurrent_stages_and_disabling(monkeypatch):
+    monkeypatch.setitem(lasso_profiling._settings, "trace_file", None)
+    lasso_profiling.enable()
+    other_records = []
+
+    def other_operation():
+        with lasso_profiling.stage("Preview") as records:
+            with lasso_profiling.stage("Mask (projection)"):
+                pass
+        other_records.extend(records)
+
+    with lasso_profiling.stage("Lasso") as records:
+        data = np.ones(2**23, dtype=np.uint8)
+        del data
+        # a stage in another thread neither waits nor resets the peak of
+        # this one; it only records its wall time
+        thread = threading.Thread(target=other_operation)
+        thread.start()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert records[0]["peak_mb"] >= 8
+    assert [record["peak_mb"] for record in other_records] == [None, None]
+    assert "MB" not in lasso_profiling.summary(other_records)
+
+    # tracing is only stopped once the open stages are left
+    with lasso_profiling.stage("Lasso") as records:
+        lasso_profiling.disable()
+        assert tracemalloc.is_tracing()
+    assert records[0]["peak_mb"] >= 0
+    assert not tracemalloc.is_tracing()
@@ -1,2 +1,149 @@
-def test_dummy():
-    assert True
+import numpy as np
+import pytest
+from napari.components import ViewerModel
+from qtpy.QtCore import Qt
+
+from lasso_3d import Lasso3D, _widget
+from lasso_3d._widget import PREVIEW_DELAY_MS, PREVIEW_LAYER
+from lasso_3d.lasso_components import component_table
+from lasso_3d.lasso_engines import generate_mask
+
+
+@pytest.fixture
+def widget(qtbot):
+    widget = Lasso3D(ViewerModel())
+    qtbot.addWidget(widget)
+    return widget
+
+
+def _labels_layer(viewer):
+    labels = np.zeros((10, 10, 10), dtype=np.int32)
+    labels[1, 1, 1] = 1
+    labels[3, 3:5, 3] = 2
+    labels[6:9, 6, 6] = 3
+    return viewer.add_labels(labels, name="connected_components")
+
+
+def _visible_labels(layer):
+    colors = layer.colormap.map(np.arange(4, dtype=np.int32))
+    return list(np.flatnonzero(colors[:, 3] > 0))
+
+
+def test_highlight_components(widget):
+    layer = _labels_layer(widget.viewer)
+    original_colormap = layer.colormap
+
+    widget._display_connected_components(layer, 2)
+    assert _visible_labels(layer) == [2]
+    assert np.allclose(layer.colormap.map(np.int32(2)), [1, 0, 0, 1])
+
+    widget._display_connected_components(layer, 3, add_to_selection=True)
+    assert _visible_labels(layer) == [2, 3]
+    assert layer.metadata["selected_components"] == [2, 3]
+
+    widget._display_connected_components(layer, 1)
+    assert _visible_labels(layer) == [1]
+
+    # component 0 clears the selection and restores the original colors
+    widget._display_connected_components(layer, 0)
+    assert layer.metadata["selected_components"] == []
+    assert layer.metadata["all_components_colormap"] is original_colormap
+    assert layer.colormap is original_colormap
+
+
+def test_component_table_click(widget, qtbot):
+    layer = _labels_layer(widget.viewer)
+    layer.metadata["component_table"] = component_table(layer.data)
+    widget._show_component_table(layer)
+    view = widget.component_table
+    model = widget.component_table_model
+    assert model.rowCount() == 3
+
+    # the largest component comes first
+    view.sortByColumn(1, Qt.DescendingOrder)
+    assert model.label(0) == 3
+
+    widget.show()
+    qtbot.waitExposed(widget)
+    rect = view.visualRect(model.index(0, 0))
+    qtbot.mouseClick(view.viewport(), Qt.LeftButton, pos=rect.center())
+    assert layer.metadata["selected_components"] == [3]
+    assert _visible_labels(layer) == [3]
+    display_widget = (
+        widget._layer_selection_widget_display_connected_components
+    )
+    assert display_widget.component_number.value == 3
+    assert np.allclose(widget.viewer.camera.center, (7, 6, 6))
+
+
+def test_preview_debounce_and_cancel(widget, qtbot, monkeypatch):
+    viewer = widget.viewer
+    viewer.add_image(np.zeros((40, 40, 40), dtype=np.float32))
+    computed = []
+
+    def preview_mask(points, *args, **kwargs):
+        computed.append(len(points))
+        return original_preview_mask(points, *args, **kwargs)
+
+    original_preview_mask = _widget.preview_mask
+    monkeypatch.setattr(_widget, "preview_mask", preview_mask)
+    errors = []
+    monkeypatch.setattr(
+        _widget.napari.utils.notifications, "show_error", errors.append
+    )
+    widget.preview_checkbox.setChecked(True)
+
+    # collinear points span no polygon: no preview and no error
+    points_layer = viewer.add_points(ndim=3, name="lasso-points")
+    for point in [(20, 5, 5), (20, 10, 10), (20, 15, 15)]:
+        points_layer.add(point)
+    qtbot.wait(2 * PREVIEW_DELAY_MS)
+    qtbot.waitUntil(lambda: not widget._requests)
+    assert computed == [3]
+    assert PREVIEW_LAYER not in viewer.layers
+    assert not errors
+
+    # a burst of edits is previewed once
+    points_layer.data = np.empty((0, 3))
+    for point in [(20, 5, 5), (20, 5, 30), (20, 30, 30), (20, 30, 5)]:
+        points_layer.add(point)
+    qtbot.waitUntil(lambda: PREVIEW_LAYER in viewer.layers)
+    assert computed == [3, 4]
+    assert viewer.layers[PREVIEW_LAYER].data.shape == (10, 10, 10)
+
+    # switching the preview off drops a running preview
+    widget.preview_checkbox.setChecked(False)
+    assert PREVIEW_LAYER not in viewer.layers
+    widget.preview_checkbox.setChecked(True)
+    widget._update_preview()
+    widget.preview_checkbox.setChecked(False)
+    qtbot.waitUntil(lambda: not widget._requests)
+    qtbot.wait(2 * PREVIEW_DELAY_MS)
+    assert PREVIEW_LAYER not in viewer.layers
+    assert not errors
+
+
+def test_live_update(widget, qtbot):
+    viewer = widget.viewer
+    image_layer = viewer.add_image(np.zeros((30, 30, 30), dtype=np.float32))
+    points = np.array([(15, 5, 5), (15, 5, 25), (15, 25, 25), (15, 25, 5)])
+    points_layer = viewer.add_points(points, name="lasso-points")
+    widget._lasso_from_polygon(points_layer, image_layer, live_update=True)
+    qtbot.waitUntil(lambda: "mask" in viewer.layers and not widget._requests)
+    mask_layer = viewer.layers["mask"]
+    num_callbacks = len(points_layer.events.data.callbacks)
+
+    # moving a vertex patches the mask in place
+    mask = mask_layer.data
+    points[2] = (15, 28, 20)
+    points_layer.data = points
+    assert widget._requests.is_busy(id(mask_layer))
+    qtbot.waitUntil(lambda: not widget._requests)
+    assert mask_layer.data is mask
+    assert np.array_equal(mask, generate_mask(points, mask.shape))
+
+    # the update is disconnected once the mask layer was removed
+    viewer.layers.remove(mask_layer)
+    points_layer.data = points[:3]
+    assert not widget._requests
+    assert len(points_layer.events.data.callbacks) == num_callbacks - 1
@@ -0,0 +1,66 @@
+import pytest
+
+from lasso_3d._workers import (
+    OperationCancelled,
+    ProgressReporter,
+    ProgressSignals,
+    RequestQueue,
+)
+
+
+def test_progress_reporter_cancellation():
+    signals = ProgressSignals()
+    reported = []
+    signals.progress.connect(lambda *args: reported.append(args))
+    reporter = ProgressReporter("Lasso", signals)
+
+    reporter("Extending slices", 1, 10)
+    assert reported == [("Lasso", "Extending slices", 1, 10)]
+
+    reporter.cancel()
+    with pytest.raises(OperationCancelled, match="Lasso was cancelled"):
+        reporter("Closing holes")
+    assert len(reported) == 1
+
+
+def test_request_queue():
+    queue = RequestQueue()
+    reporter = ProgressReporter("Lasso", ProgressSignals())
+    assert not queue.is_busy("image")
+    queue.start("image", reporter)
+    assert queue and queue.is_busy("image")
+
+    # requests for a busy layer wait in order; repeats of the same
+    # operation replace the waiting one
+    queue.enqueue("image", "Lasso", "lasso 1")
+    queue.enqueue("image", "Mask Volume", "mask")
+    queue.enqueue("image", "Lasso", "lasso 2")
+    queue.enqueue("other", "Lasso", "other lasso")
+
+    assert queue.finish("image") == ("Lasso", "lasso 2")
+    queue.start("image", reporter)
+    assert queue.finish("image") == ("Mask Volume", "mask")
+    assert queue.finish("image") is None
+    assert not queue
+
+    queue.start("other", reporter)
+    queue.cancel()
+    assert queue.pending == {}
+    with pytest.raises(OperationCancelled):
+        reporter("Lasso")
+
+
+def test_request_queue_cancel_key():
+    queue = RequestQueue()
+    preview = ProgressReporter("Preview", ProgressSignals())
+    lasso = ProgressReporter("Lasso", ProgressSignals())
+    queue.start("preview", preview)
+    queue.start("image", lasso)
+    queue.enqueue("preview", "Preview", "request 1")
+    queue.enqueue("image", "Lasso", "request 2")
+
+    queue.cancel("preview")
+    assert queue.pending == {("image", "Lasso"): "request 2"}
+    with pytest.raises(OperationCancelled):
+        preview("Preview")
+    lasso("Lasso")
@@ -1,52 +1,184 @@
+import logging
+import os
+from functools import partial
 from typing import List
+
 import napari
-from napari.utils import DirectLabelColormap
 import numpy as np
 from magicgui import magicgui
-from membrain_seg.segmentation.dataloading.data_utils import store_tomogram
 from napari.layers.shapes._shapes_constants import Mode
 from napari.layers.shapes._shapes_mouse_bindings import add_path_polygon_lasso
+from napari.qt.threading import create_worker
+from napari.utils import DirectLabelColormap
+from qtpy.QtCore import QTimer
 from qtpy.QtWidgets import (
+    QAbstractItemView,
+    QCheckBox,
+    QComboBox,
+    QDoubleSpinBox,
     QHBoxLayout,
+    QLabel,
+    QProgressBar,
     QPushButton,
+    QTableView,
     QVBoxLayout,
     QWidget,
 )
-from scipy.ndimage import label
-from skimage.morphology import binary_opening
 
-from lasso_3d.lasso_add_slices import mask_via_extension
+from lasso_3d import lasso_profiling
+from lasso_3d._component_table import ComponentTableModel
+from lasso_3d._workers import (
+    OperationCancelled,
+    ProgressReporter,
+    ProgressSignals,
+    RequestQueue,
+)
+from lasso_3d.lasso_cache import MaskCache
+from lasso_3d.lasso_chunked import (
+    is_lazy_array,
+    lazy_mask_via_projection,
+    lazy_mask_volume,
+)
+from lasso_3d.lasso_components import (
+    component_table,
+    connected_components,
+    remove_components,
+    table_bounding_boxes,
+)
+from lasso_3d.lasso_composite import COMPOSITE_OPERATIONS, composite_masks
+from lasso_3d.lasso_engines import (
+    MASK_ENGINES,
+    generate_mask,
+    preview_mask,
+)
+from lasso_3d.lasso_incremental import recompute_changed_region
+from lasso_3d.lasso_io import (
+    STORE_BACKENDS,
+    store_component_table,
+    store_components,
+    store_mask_full,
+    store_tomogram,
+)
+from lasso_3d.lasso_labelling import CONNECTIVITIES
+from lasso_3d.lasso_masking import MASKING_MODES, mask_volume
+from lasso_3d.lasso_packed import PackedMask
+from lasso_3d.lasso_utils import shift_into, simplify_polygon
 from lasso_3d.shapes_overwrites import redefine_shapelayer_functions
 
+# largest label that can be selected for displaying or storing
+MAX_LABEL = 2**31 - 1
+# name of the layer showing the low-resolution lasso preview
+PREVIEW_LAYER = "lasso-preview"
+# delay after the last edit of the lasso points before the preview is updated
+PREVIEW_DELAY_MS = 300
+
+logger = logging.getLogger(__name__)
+
 
 class Lasso3D(QWidget):
     def __init__(self, viewer: "napari.viewer.Viewer"):
         super().__init__()
         self.viewer = viewer
 
+        # recently generated masks, reused when lassoing the same polygon
+        self._mask_cache = MaskCache()
+
         self.annotation_box = QHBoxLayout()
         btn_freehand = QPushButton("Freehand")
         btn_freehand.clicked.connect(self._on_click_freehand)
         btn_points = QPushButton("Points")
         btn_points.clicked.connect(self._on_click_polygon)
+        # tolerance (in voxels) for simplifying freehand lassos
+        self.simplify_tolerance = QDoubleSpinBox()
+        self.simplify_tolerance.setRange(0, 100)
+        self.simplify_tolerance.setSingleStep(0.5)
+        self.simplify_tolerance.setValue(1.0)
+        self.simplify_tolerance.setToolTip(
+            "Maximum deviation (in voxels) when removing vertices of "
+            "freehand lassos; 0 keeps all vertices"
+        )
         self.annotation_box.addWidget(btn_freehand)
         self.annotation_box.addWidget(btn_points)
+        self.annotation_box.addWidget(QLabel("Simplify (voxels)"))
+        self.annotation_box.addWidget(self.simplify_tolerance)
+
+        # low-resolution preview of the lasso while its points are placed;
+        # recomputed when no points were changed for PREVIEW_DELAY_MS
+        self.preview_box = QHBoxLayout()
+        self.preview_checkbox = QCheckBox("Preview lasso")
+        self.preview_checkbox.setToolTip(
+            "Show a low-resolution mask of the lasso while placing points"
+        )
+        self.preview_checkbox.toggled.connect(self._on_preview_toggled)
+        self.preview_binning = QComboBox()
+        self.preview_binning.addItems(["2", "4", "8"])
+        self.preview_binning.setCurrentText("4")
+        self.preview_binning.currentTextChanged.connect(self._schedule_preview)
+        self._preview_points = None
+        self._preview_timer = QTimer()
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.setInterval(PREVIEW_DELAY_MS)
+        self._preview_timer.timeout.connect(self._update_preview)
+        self.preview_box.addWidget(self.preview_checkbox)
+        self.preview_box.addWidget(QLabel("Binning"))
+        self.preview_box.addWidget(self.preview_binning)
 
         self.selection_box = QHBoxLayout()
         self._layer_selection_widget = magicgui(
             self._lasso_from_polygon,
             points_layer={"choices": self._get_valid_points_layers},
             image_layer={"choices": self._get_valid_image_layers},
+            engine={"choices": list(MASK_ENGINES.keys())},
+            cache_size_mb={
+                "value": 512,
+                "widget_type": "SpinBox",
+                "min": 0,
+                "max": 65536,
+                "label": "Mask cache (MB)",
+            },
+            live_update={
+                "value": False,
+                "widget_type": "CheckBox",
+                "label": "Update mask when points are edited",
+            },
+            packed_mask={
+                "value": False,
+                "widget_type": "CheckBox",
+                "label": "Bit-packed mask (1 bit per voxel)",
+            },
             call_button="Lasso",
         )
         self.selection_box.addWidget(self._layer_selection_widget.native)
 
+        self.batch_selection_box = QHBoxLayout()
+        self._batch_selection_widget = magicgui(
+            self._lasso_from_polygons,
+            points_layers={
+                "choices": self._get_valid_points_layers,
+                "widget_type": "Select",
+            },
+            image_layer={"choices": self._get_valid_image_layers},
+            operation={
+                "choices": list(COMPOSITE_OPERATIONS),
+                "label": "Operation (after first lasso)",
+            },
+            engine={"choices": list(MASK_ENGINES.keys())},
+            packed_mask={
+                "value": False,
+                "widget_type": "CheckBox",
+                "label": "Bit-packed mask (1 bit per voxel)",
+            },
+            call_button="Lasso (combine)",
+        )
+        self.batch_selection_box.addWidget(self._batch_selection_widget.native)
+
         self.mask_seg_box = QHBoxLayout()
         self._layer_selection_widget_mask = magicgui(
             self._mask_volume,
             image_layer={"choices": self._get_valid_image_layers},
             mask_layer={"choices": self._get_valid_mask_layers},
-            masking={"choices": ["isolate", "subtract"]},
+            masking={"choices": list(MASKING_MODES)},
+            mode={"choices": ["copy", "in place", "lazy"]},
             call_button="Mask Volume",
         )
         self.mask_seg_box.addWidget(self._layer_selection_widget_mask.native)
@@ -67,6 +199,8 @@ class Lasso3D(QWidget):
                 "widget_type": "CheckBox",
                 "label": "Perform Opening (split touching objects)",
             },
+            connectivity={"choices": list(CONNECTIVITIES)},
+            n_workers={"value": 4, "min": 1, "max": 128},
             call_button="Connected Components",
         )
         self.connected_components_box.addWidget(
@@ -77,23 +211,48 @@ class Lasso3D(QWidget):
         self._layer_selection_widget_display_connected_components = magicgui(
             self._display_connected_components,
             components_layer={"choices": self._get_valid_image_layers},
-            component_number={"value": 1},
+            component_number={"value": 1, "max": MAX_LABEL},
+            add_to_selection={
+                "value": False,
+                "widget_type": "CheckBox",
+                "label": "Add to selection",
+            },
             call_button="Display Connected Components",
         )
         self.display_connected_components_box.addWidget(
             self._layer_selection_widget_display_connected_components.native
         )
 
+        # statistics of the components of the latest connected components
+        # layer; clicking a row displays the component
+        self._table_layer = None
+        self.component_table_box = QVBoxLayout()
+        self.component_table_model = ComponentTableModel(self)
+        self.component_table = QTableView()
+        self.component_table.setModel(self.component_table_model)
+        self.component_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.component_table.setSortingEnabled(True)
+        self.component_table.clicked.connect(self._on_component_table_clicked)
+        btn_remove_components = QPushButton("Remove Selected Components")
+        btn_remove_components.clicked.connect(self._on_click_remove_components)
+        self.component_table_box.addWidget(self.component_table)
+        self.component_table_box.addWidget(btn_remove_components)
+
         self.store_tomogram_box = QHBoxLayout()
         self.store_tomogram_widget = magicgui(
             self._store_tomogram,
             image_layer={"choices": self._get_valid_image_layers},
-            store_component_number={"value": 1, "label": "Component Number"},
+            store_component_number={
+                "value": 1,
+                "max": MAX_LABEL,
+                "label": "Component Number",
+            },
             filename={
                 "widget_type": "FileEdit",
                 "mode": "d",
                 "label": "Folder Path",
             },
+            backend={"choices": list(STORE_BACKENDS)},
             call_button="Store Tomogram",
         )
         self.store_tomogram_box.addWidget(self.store_tomogram_widget.native)
@@ -107,6 +266,18 @@ class Lasso3D(QWidget):
                 "mode": "d",
                 "label": "Folder Path",
             },
+            cropped={
+                "value": False,
+                "widget_type": "CheckBox",
+                "label": "Crop to component",
+            },
+            n_workers={
+                "value": 4,
+                "widget_type": "SpinBox",
+                "min": 1,
+                "max": 64,
+                "label": "Parallel writers",
+            },
             call_button="Store All Components",
         )
         self.store_all_components_box.addWidget(
@@ -130,26 +301,68 @@ class Lasso3D(QWidget):
         # self.color_distances_box.addWidget(color_point)
         # self.color_distances_box.addWidget(self.color_distances_widget.native)
 
+        # progress of the operations running in the background
+        self._requests = RequestQueue()
+        self._progress_signals = ProgressSignals()
+        self._progress_signals.progress.connect(self._on_worker_progress)
+        self.progress_label = QLabel("")
+        self.progress_box = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximum(1)
+        btn_cancel = QPushButton("Cancel")
+        btn_cancel.clicked.connect(self._on_click_cancel)
+        # time and memory of every stage (also enabled by LASSO_3D_PROFILE)
+        self.profile_checkbox = QCheckBox("Profile")
+        self.profile_checkbox.setToolTip(
+            "Report wall time and peak memory of every stage; set "
+            f"{lasso_profiling.TRACE_ENV} to also append them to a JSON "
+            "trace file"
+        )
+        self.profile_checkbox.setChecked(lasso_profiling.is_enabled())
+        self.profile_checkbox.toggled.connect(self._on_profile_toggled)
+        self.progress_box.addWidget(self.progress_bar)
+        self.progress_box.addWidget(btn_cancel)
+        self.progress_box.addWidget(self.profile_checkbox)
+
         self.setLayout(QVBoxLayout())
         self.layout().addLayout(self.annotation_box)
+        self.layout().addLayout(self.preview_box)
         self.layout().addLayout(self.selection_box)
+        self.layout().addLayout(self.batch_selection_box)
         self.layout().addLayout(self.mask_seg_box)
         self.layout().addLayout(self.connected_components_box)
         self.layout().addLayout(self.display_connected_components_box)
+        self.layout().addLayout(self.component_table_box)
         self.layout().addLayout(self.store_tomogram_box)
         self.layout().addLayout(self.store_all_components_box)
         # self.layout().addLayout(self.color_distances_box)
+        self.layout().addWidget(self.progress_label)
+        self.layout().addLayout(self.progress_box)
 
         viewer.layers.events.inserted.connect(self._on_layer_change)
         viewer.layers.events.removed.connect(self._on_layer_change)
+        for layer in viewer.layers:
+            if isinstance(layer, napari.layers.Points):
+                layer.events.data.connect(self._on_points_edited)
 
     def _on_layer_change(self, event):
+        if event.type == "inserted" and isinstance(
+            event.value, napari.layers.Points
+        ):
+            event.value.events.data.connect(self._on_points_edited)
+            self._on_points_edited(event)
         self._layer_selection_widget.points_layer.choices = (
             self._get_valid_points_layers(None)
         )
         self._layer_selection_widget.image_layer.choices = (
             self._get_valid_image_layers(None)
         )
+        self._batch_selection_widget.points_layers.choices = (
+            self._get_valid_points_layers(None)
+        )
+        self._batch_selection_widget.image_layer.choices = (
+            self._get_valid_image_layers(None)
+        )
         self._layer_selection_widget_mask.image_layer.choices = (
             self._get_valid_image_layers(None)
         )
@@ -171,6 +384,8 @@ class Lasso3D(QWidget):
         # self.color_distances_widget.image_layer.choices = (
         #     self._get_valid_labels_layers(None)
         # )
+        if self._table_layer not in self.viewer.layers:
+            self._show_component_table(None)
 
     # def _on_click_color_point(self):
     #     """
@@ -264,6 +479,11 @@ class Lasso3D(QWidget):
                         axis=0,
                     )
 
+                    # Remove nearly collinear points of the freehand path
+                    points = simplify_polygon(
+                        points, self.simplify_tolerance.value()
+                    )
+
                     # Add the points to the viewer
                     self.viewer.add_points(
                         points,
@@ -296,59 +516,398 @@ class Lasso3D(QWidget):
             size=3,
         )
 
+    def _on_preview_toggled(self, checked):
+        if checked:
+            self._schedule_preview()
+            return
+        self._preview_timer.stop()
+        self._requests.cancel(PREVIEW_LAYER)
+        if PREVIEW_LAYER in self.viewer.layers:
+            self.viewer.layers.remove(PREVIEW_LAYER)
+
+    def _on_points_edited(self, event):
+        """
+        Preview the lasso of the edited points layer after a short delay.
+        """
+        if event.type == "inserted":
+            self._preview_points = event.value
+        else:
+            self._preview_points = event.source
+        self._schedule_preview()
+
+    def _schedule_preview(self, *args):
+        # restarting the timer debounces bursts of edits
+        if self.preview_checkbox.isChecked():
+            self._preview_timer.start()
+
+    def _update_preview(self):
+        """
+        Compute a binned mask of the previewed lasso in the background and
+        show it scaled to the tomogram selected for lassoing.
+        """
+        points_layer = self._preview_points
+        image_layer = self._layer_selection_widget.image_layer.value
+        if (
+            points_layer is None
+            or points_layer not in self.viewer.layers
+            or image_layer is None
+            or len(points_layer.data) < 3
+        ):
+            return
+        points = points_layer.data.copy()
+        volume_shape = image_layer.data.shape
+        binning = int(self.preview_binning.currentText())
+
+        def compute(progress_callback):
+            # points placed so far may not span a polygon yet
+            try:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    return preview_mask(
+                        points,
+                        volume_shape,
+                        binning=binning,
+                        progress_callback=progress_callback,
+                    )
+            except ValueError as error:
+                logger.debug("No preview of the lasso: %s", error)
+                return None
+
+        def on_done(mask):
+            # skip results of outdated points or of a switched off preview
+            if (
+                mask is None
+                or not self.preview_checkbox.isChecked()
+                or self._preview_points is not points_layer
+                or not np.array_equal(points_layer.data, points)
+            ):
+                return
+            # binned voxels are centered on the voxels they cover
+            scale = np.asarray(image_layer.scale) * binning
+            translate = np.asarray(image_layer.translate) + (
+                np.asarray(image_layer.scale) * (binning - 1) / 2
+            )
+            if PREVIEW_LAYER in self.viewer.layers:
+                preview_layer = self.viewer.layers[PREVIEW_LAYER]
+                preview_layer.data = mask
+                preview_layer.scale = scale
+                preview_layer.translate = translate
+                return
+            self.viewer.add_image(
+                mask,
+                name=PREVIEW_LAYER,
+                colormap="magenta",
+                opacity=0.25,
+                blending="additive",
+                scale=scale,
+                translate=translate,
+            )
+
+        self._run_in_background(
+            PREVIEW_LAYER, "Preview", compute, on_done, quiet=True
+        )
+
+    def _run_in_background(
+        self, key, description, compute, on_done, quiet=False
+    ):
+        """
+        Run compute(progress_callback) in a napari thread worker.
+
+        on_done is called with the result on the main thread. Requests with
+        the same key (i.e. on the same layer) are not run concurrently: while
+        one is running, further requests are queued and run in order, where
+        a request replaces a queued request of the same operation
+        (description). If profiling is enabled, the operation
+        is profiled and a summary is shown. With quiet, neither queued
+        requests, profiles nor cancellations are notified.
+        """
+        if self._requests.is_busy(key):
+            self._requests.enqueue(key, description, (compute, on_done, quiet))
+            if not quiet:
+                napari.utils.notifications.show_info(
+                    f"{description} queued until the running operation "
+                    "finished"
+                )
+            return
+
+        def run(progress_callback):
+            with lasso_profiling.stage(description) as records:
+                result = compute(progress_callback)
+            return result, records
+
+        def done(result):
+            result, records = result
+            if records and not quiet:
+                napari.utils.notifications.show_info(
+                    lasso_profiling.summary(records)
+                )
+            on_done(result)
+
+        reporter = ProgressReporter(description, self._progress_signals)
+        self._requests.start(key, reporter)
+        create_worker(
+            run,
+            reporter,
+            _connect={
+                "returned": done,
+                "errored": partial(self._on_worker_errored, quiet=quiet),
+                "finished": partial(self._on_worker_finished, key),
+            },
+        )
+
+    def _on_profile_toggled(self, checked):
+        if checked:
+            lasso_profiling.enable()
+        else:
+            lasso_profiling.disable()
+
+    def _on_worker_progress(self, description, stage, step, total):
+        self.progress_label.setText(f"{description}: {stage}")
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(min(step, total))
+
+    def _on_worker_errored(self, error, quiet=False):
+        if isinstance(error, OperationCancelled):
+            if not quiet:
+                napari.utils.notifications.show_info(str(error))
+            return
+        # report the error; the cleanup is done when the worker finished
+        napari.utils.notifications.show_error(
+            f"{type(error).__name__}: {error}"
+        )
+
+    def _on_worker_finished(self, key):
+        next_request = self._requests.finish(key)
+        if next_request is not None:
+            description, request = next_request
+            self._run_in_background(key, description, *request)
+        elif not self._requests:
+            self.progress_label.setText("")
+            self.progress_bar.setMaximum(1)
+            self.progress_bar.setValue(0)
+
+    def _on_click_cancel(self):
+        self._requests.cancel()
+
     def _lasso_from_polygon(
         self,
         points_layer: napari.layers.Points,
         image_layer: napari.layers.Image,
+        engine: str = "projection",
+        cache_size_mb: int = 512,
+        live_update: bool = False,
+        packed_mask: bool = False,
     ):
         if (points_layer is None) or (image_layer is None):
             return
+        self._mask_cache.resize(cache_size_mb * 2**20)
 
         # Get the selected points
-        points = points_layer.data
+        points = points_layer.data.copy()
 
         # get the volume shape
         volume_shape = image_layer.data.shape
+        lazy = is_lazy_array(image_layer.data)
+        if lazy and engine != "projection":
+            napari.utils.notifications.show_info(
+                "Lazy volume: mask is computed with the projection engine"
+            )
+
+        def compute(progress_callback):
+            # generate the mask; lazily loaded volumes get a lazy mask with
+            # the same chunks, which is evaluated chunk by chunk on demand
+            if lazy:
+                return lazy_mask_via_projection(
+                    points, volume_shape, chunks=image_layer.data.chunks
+                )
+            if packed_mask:
+                # only the cropped mask is held unpacked
+                mask_cropped, offset = generate_mask(
+                    points,
+                    volume_shape,
+                    engine=engine,
+                    crop=True,
+                    cache=self._mask_cache,
+                    progress_callback=progress_callback,
+                )
+                return shift_into(
+                    mask_cropped, offset, out=PackedMask.zeros(volume_shape)
+                )
+            return generate_mask(
+                points,
+                volume_shape,
+                engine=engine,
+                cache=self._mask_cache,
+                progress_callback=progress_callback,
+            )
+
+        def on_done(mask):
+            # the full-resolution mask replaces the preview
+            if PREVIEW_LAYER in self.viewer.layers:
+                self.viewer.layers.remove(PREVIEW_LAYER)
+            # add the mask to the viewer
+            mask_layer = self.viewer.add_image(mask, name="mask", opacity=0.4)
+            mask_layer.colormap = "green"
+            points_layer.visible = False
+            if live_update:
+                self._connect_live_update(points_layer, mask_layer, points)
+
+        if live_update and (lazy or engine != "projection"):
+            napari.utils.notifications.show_info(
+                "Live updates are only supported for in-memory volumes "
+                "with the projection engine"
+            )
+            live_update = False
+        self._run_in_background(id(image_layer), "Lasso", compute, on_done)
+
+    def _connect_live_update(self, points_layer, mask_layer, points):
+        """
+        Patch the mask whenever the points of its lasso are edited.
+
+        Only the region in which the old and new lasso can differ is
+        recomputed and written into the existing mask layer. Updates run
+        with the key of the mask layer, like other operations reading the
+        mask; masking a volume uses a snapshot of the mask.
+        """
+        mask_layer.metadata["lasso_polygon"] = points
+
+        def on_points_changed(event):
+            if mask_layer not in self.viewer.layers:
+                points_layer.events.data.disconnect(on_points_changed)
+                return
+            if len(points_layer.data) < 3:
+                return
+            new_points = points_layer.data.copy()
+
+            def compute(progress_callback):
+                return new_points, recompute_changed_region(
+                    mask_layer.metadata["lasso_polygon"],
+                    new_points,
+                    mask_layer.data.shape,
+                    progress_callback=progress_callback,
+                )
+
+            def on_done(result):
+                new_points, update = result
+                mask_layer.metadata["lasso_polygon"] = new_points
+                if update is not None:
+                    region, patch = update
+                    mask_layer.data[region] = patch
+                    mask_layer.refresh()
+
+            self._run_in_background(
+                id(mask_layer), "Update mask", compute, on_done
+            )
+
+        points_layer.events.data.connect(on_points_changed)
+
+    def _lasso_from_polygons(
+        self,
+        points_layers: List[napari.layers.Points],
+        image_layer: napari.layers.Image,
+        operation: str = "subtract",
+        engine: str = "projection",
+        packed_mask: bool = False,
+    ):
+        """
+        Combine several lassos into a single mask.
+
+        The first selected lasso is added to an empty mask, all following
+        lassos are combined with it using the selected operation.
+        """
+        if (not points_layers) or (image_layer is None):
+            return
+
+        polygons = [points_layer.data.copy() for points_layer in points_layers]
+        operations = ["union"] + [operation] * (len(polygons) - 1)
+        volume_shape = image_layer.data.shape
 
-        # generate the mask
-        mask = mask_via_extension(points, volume_shape)
+        def compute(progress_callback):
+            # generate the combined mask
+            return composite_masks(
+                polygons,
+                operations,
+                volume_shape,
+                engine=engine,
+                mask=PackedMask.zeros(volume_shape) if packed_mask else None,
+                cache=self._mask_cache,
+                progress_callback=progress_callback,
+            )
 
-        # add the mask to the viewer
-        mask_layer = self.viewer.add_image(mask, name="mask", opacity=0.4)
-        mask_layer.colormap = "green"
-        points_layer.visible = False
+        def on_done(mask):
+            # add the mask to the viewer
+            mask_layer = self.viewer.add_image(mask, name="mask", opacity=0.4)
+            mask_layer.colormap = "green"
+            for points_layer in points_layers:
+                points_layer.visible = False
 
-        return
+        self._run_in_background(
+            id(image_layer), "Lasso (combine)", compute, on_done
+        )
 
     def _mask_volume(
         self,
         image_layer: napari.layers.Image,
         mask_layer: napari.layers.Image,
         masking: str,
+        mode: str = "copy",
     ):
+        """
+        Mask a volume and add the result as new layer.
+
+        With mode "copy", the masked volume is a new array. With "in place",
+        the volume of the image layer is modified within the bounding box of
+        the mask. With "lazy" (and for lazily loaded volumes), the masked
+        volume is a dask array that is only computed for the displayed or
+        used chunks, e.g. of a memory-mapped tomogram.
+        """
         if (image_layer is None) or (mask_layer is None):
             return
 
-        # get the mask
+        # get the mask; live-updated masks are patched on the main thread
+        # while the volume is masked, so they are masked with a snapshot
         mask = mask_layer.data
+        if "lasso_polygon" in mask_layer.metadata:
+            mask = mask.copy()
 
         # get the volume
         volume = image_layer.data
+        lazy = mode == "lazy" or is_lazy_array(volume) or is_lazy_array(mask)
+        if mode == "in place" and not lazy and not volume.flags.writeable:
+            napari.utils.notifications.show_info(
+                "Volume is read-only: masking a copy instead"
+            )
+            mode = "copy"
 
-        masked_volume = volume.copy()
-        if masking == "isolate":
-            masked_volume[~mask] = 0
-        elif masking == "subtract":
-            masked_volume[mask] = 0
+        def compute(progress_callback):
+            if lazy:
+                return lazy_mask_volume(volume, mask, masking)
+            return mask_volume(
+                volume,
+                mask,
+                masking,
+                in_place=mode == "in place",
+                progress_callback=progress_callback,
+            )
 
-        # add the masked volume to the viewer
-        self.viewer.add_image(masked_volume, name="masked_volume")
-        image_layer.visible = False
-        mask_layer.visible = False
+        def on_done(masked_volume):
+            mask_layer.visible = False
+            if mode == "in place" and not lazy:
+                image_layer.refresh()
+                masked_layer = image_layer
+            else:
+                # add the masked volume to the viewer
+                masked_layer = self.viewer.add_image(
+                    masked_volume, name="masked_volume"
+                )
+                image_layer.visible = False
+
+            # set masked_volume to default layer for connected components
+            self._layer_selection_widget_connected_components.mask_layer.value = (
+                masked_layer
+            )
 
-        # set masked_volume to default layer for connected components
-        self._layer_selection_widget_connected_components.mask_layer.value = (
-            self.viewer.layers[-1]
+        self._run_in_background(
+            id(image_layer), "Mask Volume", compute, on_done
         )
 
     def _connected_components(
@@ -356,104 +915,253 @@ class Lasso3D(QWidget):
         mask_layer: napari.layers.Image,
         remove_small_objects_size: int,
         perform_opening: bool,
+        connectivity: int = 6,
+        n_workers: int = 4,
     ):
         if mask_layer is None:
             return
 
         mask = mask_layer.data
-        mask = mask > 0
 
-        # # first do morphological operations to remove small objects
-
-        if perform_opening:
-            mask = binary_opening(mask)
+        def compute(progress_callback):
+            components, component_sizes = connected_components(
+                mask,
+                remove_small_objects_size,
+                perform_opening,
+                connectivity=connectivity,
+                n_workers=n_workers,
+                progress_callback=progress_callback,
+            )
+            # mean intensities are only meaningful for a masked volume
+            table = component_table(
+                components,
+                intensities=None if mask.dtype == bool else mask,
+                num_labels=len(component_sizes) - 1,
+                progress_callback=progress_callback,
+            )
+            return components, component_sizes, table
 
-        # get the connected components
-        components, num_components = label(mask)
+        def on_done(result):
+            components, component_sizes, table = result
 
-        # remove small objects
-        max_val = np.max(components)
-        i = 1
-        while i < max_val + 1:
-            if np.sum(components == i) < remove_small_objects_size:
-                components[components == i] = 0
-                components[components > i] -= 1
-                max_val -= 1
-            else:
-                i += 1
+            # add as labels layer, keeping the component sizes and statistics
+            # for later steps
+            components_layer = self.viewer.add_labels(
+                components, name="connected_components"
+            )
+            components_layer.metadata["component_sizes"] = component_sizes
+            components_layer.metadata["component_table"] = table
+            mask_layer.visible = False
+            self._show_component_table(components_layer)
 
-        # add as labels layer
-        self.viewer.add_labels(components, name="connected_components")
-        mask_layer.visible = False
+            # set connected_components to default layer for display connected components and store tomogram and store all components
+            self._layer_selection_widget_display_connected_components.components_layer.value = self.viewer.layers[
+                -1
+            ]
+            self.store_tomogram_widget.image_layer.value = self.viewer.layers[
+                -1
+            ]
+            self.store_all_components_widget.image_layer.value = (
+                self.viewer.layers[-1]
+            )
 
-        # set connected_components to default layer for display connected components and store tomogram and store all components
-        self._layer_selection_widget_display_connected_components.components_layer.value = self.viewer.layers[
-            -1
-        ]
-        self.store_tomogram_widget.image_layer.value = self.viewer.layers[-1]
-        self.store_all_components_widget.image_layer.value = (
-            self.viewer.layers[-1]
+        self._run_in_background(
+            id(mask_layer), "Connected Components", compute, on_done
         )
 
     def _display_connected_components(
         self,
         components_layer: napari.layers.Labels,
         component_number: int,
+        add_to_selection: bool = False,
     ):
+        """
+        Highlight a component (in red) and hide all others.
+
+        With add_to_selection, the component is highlighted together with the
+        previously selected ones (each in its own color). Component 0 shows
+        all components again.
+        """
         if components_layer is None:
             return
+        selected = []
+        if add_to_selection:
+            selected = components_layer.metadata.get("selected_components", [])
+        if component_number != 0 and component_number not in selected:
+            selected = selected + [component_number]
+        self._highlight_components(components_layer, selected)
+
+    def _highlight_components(self, components_layer, labels, center=None):
+        """
+        Only show the given labels of a labels layer (all if none are given).
+
+        The colormap only contains entries for the selected labels, so
+        switching the selection does not depend on the number of labels.
+        The view is centered on the component center (default: the last
+        selected one) if the layer has a component table.
+        """
+        metadata = components_layer.metadata
+        # the colormap napari assigned to the layer, to show all components
+        all_components = metadata.setdefault(
+            "all_components_colormap", components_layer.colormap
+        )
+        metadata["selected_components"] = list(labels)
+        components_layer.show_selected_label = False
+        if not labels:
+            components_layer.colormap = all_components
+            return
+
+        if len(labels) == 1:
+            colors = [(1, 0, 0, 1)]
+        else:
+            colors = all_components.map(np.asarray(labels))
+        color_dict = {None: (0, 0, 0, 0)}
+        color_dict.update(zip(labels, colors))
+        components_layer.colormap = DirectLabelColormap(color_dict=color_dict)
+
+        # center the view on the selected component
+        table = metadata.get("component_table")
+        center = labels[-1] if center is None else center
+        if table is not None and center in table["label"]:
+            row = np.flatnonzero(table["label"] == center)[0]
+            self.viewer.camera.center = components_layer.data_to_world(
+                table["centroid"][row]
+            )
+
+    def _show_component_table(self, components_layer):
+        """
+        Show the statistics of the components of a labels layer in the table.
+        """
+        self._table_layer = components_layer
+        table = None
+        if components_layer is not None:
+            table = components_layer.metadata.get("component_table")
+        self.component_table_model.set_table(table)
+
+    def _selected_table_labels(self):
+        rows = self.component_table.selectionModel().selectedRows()
+        return [
+            self.component_table_model.label(index.row())
+            for index in sorted(rows, key=lambda index: index.row())
+        ]
+
+    def _on_component_table_clicked(self, index):
+        """
+        Highlight the components of all selected rows, centered on the
+        clicked one.
+        """
+        if self._table_layer is None:
+            return
+        label = self.component_table_model.label(index.row())
+        display_widget = (
+            self._layer_selection_widget_display_connected_components
+        )
+        display_widget.components_layer.value = self._table_layer
+        display_widget.component_number.value = label
+        self._highlight_components(
+            self._table_layer, self._selected_table_labels(), center=label
+        )
 
-        max_label = components_layer.data.max()
-        colors = {i: (0, 0, 0, 0) for i in range(max_label + 1)}
-        colors[component_number] = (
-            1,
-            0,
-            0,
-            1,
-        )  # Set the label of interest to red with full opacity
-
-        if component_number == 0:
-            # set labels with random colors
-            colors = {
-                i: np.concatenate((np.random.rand(3), [1]))
-                for i in range(max_label + 1)
-            }
-            colors[0] = (0, 0, 0, 0)  # Set the background to be transparent
-
-        # Create a custom colormap in proper format
-        colors[None] = None
-        cmap = DirectLabelColormap()
-        cmap.color_dict = colors
-
-        # Apply the custom colormap to the existing layer
-        components_layer.colormap = cmap
+    def _on_click_remove_components(self):
+        """
+        Remove the components selected in the table from their labels layer.
+        """
+        components_layer = self._table_layer
+        labels = self._selected_table_labels()
+        if components_layer is None or not labels:
+            return
+        if not components_layer.data.flags.writeable:
+            napari.utils.notifications.show_info(
+                "Labels are read-only: components cannot be removed"
+            )
+            return
+        metadata = components_layer.metadata
+        metadata["component_table"] = remove_components(
+            components_layer.data, metadata["component_table"], labels
+        )
+        if "component_sizes" in metadata:
+            component_sizes = metadata["component_sizes"]
+            component_sizes[0] += component_sizes[labels].sum()
+            component_sizes[labels] = 0
+        components_layer.refresh()
+        self._show_component_table(components_layer)
 
     def _store_tomogram(
         self,
         image_layer: napari.layers.Image,
         store_component_number: int,
         filename: str,
+        backend: str = "mrcfile",
     ):
         if image_layer is None:
             return
-        out_data = (image_layer.data == store_component_number) * 1.0
-        out_data = np.transpose(out_data, (2, 1, 0))
-        store_tomogram(filename, out_data)
+        with lasso_profiling.stage("Store Tomogram") as records:
+            self._write_component(
+                image_layer, store_component_number, filename, backend
+            )
+        if records:
+            napari.utils.notifications.show_info(
+                lasso_profiling.summary(records)
+            )
+
+    def _write_component(
+        self, image_layer, component_number, filename, backend
+    ):
+        table = image_layer.metadata.get("component_table")
+        if (
+            backend == "mrcfile"
+            and table is not None
+            and component_number in table["label"]
+        ):
+            # only extract the component from its bounding box
+            row = np.flatnonzero(table["label"] == component_number)[0]
+            start, stop = table["bbox_start"][row], table["bbox_stop"][row]
+            region = tuple(slice(a, b) for a, b in zip(start, stop))
+            store_mask_full(
+                filename,
+                image_layer.data[region] == component_number,
+                start,
+                image_layer.data.shape,
+            )
+            return
+        out_data = image_layer.data == component_number
+        try:
+            store_tomogram(filename, out_data, backend=backend)
+        except ImportError as error:
+            napari.utils.notifications.show_error(str(error))
 
     def _store_all_components(
         self,
         image_layer: napari.layers.Image,
         foldername: str,
+        cropped: bool = False,
+        n_workers: int = 4,
     ):
-        print("Storing all components")
+        logger.info("Storing all components")
         if image_layer is None:
             return
-        out_data = image_layer.data
-        for i in range(1, np.max(out_data) + 1):
-            print("Storing component", i)
-            out_data_i = (out_data == i) * 1.0
-            out_data_i = np.transpose(out_data_i, (2, 1, 0))
-            store_tomogram(str(foldername) + f"/component_{i}.mrc", out_data_i)
+        components = image_layer.data
+        table = image_layer.metadata.get("component_table")
+
+        def compute(progress_callback):
+            bounding_boxes = None
+            if table is not None:
+                store_component_table(
+                    os.path.join(str(foldername), "components.csv"), table
+                )
+                bounding_boxes = table_bounding_boxes(table)
+            store_components(
+                components,
+                foldername,
+                cropped=cropped,
+                n_workers=n_workers,
+                bounding_boxes=bounding_boxes,
+                progress_callback=progress_callback,
+            )
+
+        self._run_in_background(
+            id(image_layer), "Store All Components", compute, lambda _: None
+        )
 
     def _get_valid_points_layers(
         self, combo_box
@@ -0,0 +1,97 @@
+import threading
+
+from qtpy.QtCore import QObject, Signal
+
+
+class OperationCancelled(Exception):
+    """
+    Raised inside a background worker when the operation was cancelled.
+    """
+
+
+class ProgressSignals(QObject):
+    """
+    Signals to report progress from a worker thread to the main thread.
+    """
+
+    # description, stage, step, total
+    progress = Signal(str, str, int, int)
+
+
+class ProgressReporter:
+    """
+    Progress callback handed to the lasso functions running in a worker.
+
+    Every call reports the current stage and iteration and raises
+    OperationCancelled if cancellation was requested in the meantime.
+    """
+
+    def __init__(self, description, signals):
+        self.description = description
+        self.signals = signals
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def __call__(self, stage, step=0, total=0):
+        if self.cancel_event.is_set():
+            raise OperationCancelled(f"{self.description} was cancelled")
+        self.signals.progress.emit(self.description, stage, step, total)
+
+
+class RequestQueue:
+    """
+    Bookkeeping of the operations running in the background.
+
+    At most one operation runs per key (e.g. per layer). Further requests
+    for a busy key wait in first-in, first-out order; a new request for an
+    operation (description) that is already waiting for the same key
+    replaces the waiting one, so only repeats of the same operation are
+    merged.
+    """
+
+    def __init__(self):
+        # key -> ProgressReporter of the running operation
+        self.running = {}
+        # (key, description) -> request, in the order of arrival
+        self.pending = {}
+
+    def __bool__(self):
+        return bool(self.running)
+
+    def is_busy(self, key):
+        return key in self.running
+
+    def start(self, key, reporter):
+        self.running[key] = reporter
+
+    def enqueue(self, key, description, request):
+        """
+        Let a request wait until the running operation of key finished.
+        """
+        self.pending[(key, description)] = request
+
+    def finish(self, key):
+        """
+        Mark the operation of key as finished. Returns the description and
+        request of the next waiting operation of key, or None.
+        """
+        self.running.pop(key, None)
+        for pending_key, description in self.pending:
+            if pending_key == key:
+                request = self.pending.pop((pending_key, description))
+                return description, request
+        return None
+
+    def cancel(self, key=None):
+        """
+        Drop the waiting requests and cancel the running operations of key,
+        or of all keys if key is None.
+        """
+        for pending_key, description in list(self.pending):
+            if key is None or pending_key == key:
+                del self.pending[(pending_key, description)]
+        for running_key, reporter in self.running.items():
+            if key is None or running_key == key:
+                reporter.cancel()
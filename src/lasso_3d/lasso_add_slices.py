@@ -1,10 +1,16 @@
+import warnings
+
 import numpy as np
-from scipy.ndimage import binary_closing
 
+from lasso_3d.lasso_morphology import closing
+from lasso_3d.lasso_profiling import stage
 from lasso_3d.lasso_rotate_vol import create_2D_mask_from_polygon
 from lasso_3d.lasso_utils import (
     compute_normal_vector,
+    expand_to_full,
+    prism_bounding_box,
     rotate_polygon_to_xy_plane,
+    slab_intersection,
 )
 
 
@@ -12,30 +18,10 @@ def cropped_closing(volume, iterations=1):
     """
     Perform binary closing on a cropped version of the volume.
 
-    The volume is cropped to the smallest bounding box around the object.
+    The volume is cropped to the bounding box around the object, padded by
+    the reach of the closing, and closed in place.
     """
-    # find bounding box
-    coords = np.argwhere(volume)
-    min_coords = np.min(coords, axis=0)
-    max_coords = np.max(coords, axis=0)
-
-    # crop volume
-    volume_cropped = volume[
-        min_coords[0] : max_coords[0] + 1,
-        min_coords[1] : max_coords[1] + 1,
-        min_coords[2] : max_coords[2] + 1,
-    ]
-    # perform binary closing
-    volume_cropped = binary_closing(volume_cropped, iterations=iterations)
-
-    # insert cropped volume into original volume
-    volume[
-        min_coords[0] : max_coords[0] + 1,
-        min_coords[1] : max_coords[1] + 1,
-        min_coords[2] : max_coords[2] + 1,
-    ] = volume_cropped
-
-    return volume
+    return closing(volume, iterations=iterations, out=volume)
 
 
 def get_rounding_permutations(coords, permutation_nr):
@@ -70,7 +56,36 @@ def get_rounding_permutations(coords, permutation_nr):
     return coords.astype(int)
 
 
-def mask_via_extension(polygon_3d, tomo_shape):
+# offsets of the 8 corners of a grid cell
+CELL_CORNERS = np.array(list(np.ndindex(2, 2, 2)))
+
+
+def supercover_voxels(coords, padded_shape):
+    """
+    Flat indices of all voxels touched by the grid cells of the given
+    coordinates, i.e. all combinations of floor and floor + 1 per axis.
+
+    The indices refer to a volume padded by one voxel on every side (of
+    shape padded_shape), so that no corner has to be bounds-checked. Cells
+    outside of the padded volume are dropped, and the remaining cells are
+    deduplicated before their 8 corners are expanded.
+    """
+    cells = np.floor(coords).astype(np.intp) + 1
+    cells = cells[
+        ((cells >= 0) & (cells < np.subtract(padded_shape, 1))).all(axis=1)
+    ]
+    cells = np.unique(np.ravel_multi_index(cells.T, padded_shape))
+    strides = np.array([padded_shape[1] * padded_shape[2], padded_shape[2], 1])
+    return (cells[:, None] + np.dot(CELL_CORNERS, strides)).ravel()
+
+
+def mask_via_extension(
+    polygon_3d,
+    tomo_shape,
+    crop=False,
+    conservative=False,
+    progress_callback=None,
+):
     """
     Create a mask by adding slices of the polygon along its normal.
 
@@ -78,21 +93,36 @@ def mask_via_extension(polygon_3d, tomo_shape):
     1. Rotate the polygon to the xy plane.
     2. Create a 2D mask from the rotated polygon.
     3. Rotate the 2D mask back to the original orientation.
-    4. Do that for all slices along the z-axis.
+    4. Do that for all slices along the normal that hit the tomogram.
     5. Fill holes which appeared during the process.
+
+    With conservative, every rotated sample marks all 8 voxels of the grid
+    cell it falls into (supercover, see supercover_voxels) and no closing
+    is done. Samples are at most 1 voxel apart, so the mask is a
+    conservative superset of the extruded polygon up to the rasterization
+    of its outline: voxels inside are only missed within half a voxel of
+    the outline, and marked voxels lie less than sqrt(3) voxels outside.
+    At concave corners, the margin can enclose small pockets of unmarked
+    voxels.
+
+    Only the bounding box of the extruded polygon (clipped to the tomogram)
+    is allocated. If crop is True, this cropped mask is returned together
+    with its offset in the tomogram.
     """
 
     # rotate polygon to be flat
-    polygon_3d_rotated, polygon_center, rot_mat = rotate_polygon_to_xy_plane(
-        polygon_3d.copy()
-    )
-    normal_vector = compute_normal_vector(polygon_3d)
+    with stage("Rotating polygon"):
+        polygon_3d_rotated, polygon_center, rot_mat = (
+            rotate_polygon_to_xy_plane(polygon_3d.copy())
+        )
+        normal_vector = compute_normal_vector(polygon_3d)
 
     polygon_2d = polygon_3d_rotated[:, :2]
     z_component = polygon_3d_rotated[0, 2]
 
     # create 2D mask
-    mask_2d, shift = create_2D_mask_from_polygon(polygon_2d.copy())
+    with stage("Creating 2D mask"):
+        mask_2d, shift = create_2D_mask_from_polygon(polygon_2d.copy())
 
     # get 2D mask coordinates and shift to projected polygon center and add z-component
     mask_coords = np.argwhere(mask_2d)
@@ -101,49 +131,60 @@ def mask_via_extension(polygon_3d, tomo_shape):
     mask_coords_orig = np.concatenate(
         [mask_coords, np.ones((mask_coords.shape[0], 1)) * z_component], axis=1
     )
-
-    volume = np.zeros(tomo_shape, dtype=bool)
     mask_coords_3D = np.dot(mask_coords_orig, rot_mat) + polygon_center
-    max_range = np.max(tomo_shape) * 2
-
-    for z in range(-1, -max_range, -1):
-        cur_coords = mask_coords_3D + z * normal_vector
-        if (
-            all(cur_coords[:, 2] < 0)
-            or all(cur_coords[:, 2] >= tomo_shape[2])
-            or all(cur_coords[:, 0] < 0)
-            or all(cur_coords[:, 0] >= tomo_shape[0])
-            or all(cur_coords[:, 1] < 0)
-            or all(cur_coords[:, 1] >= tomo_shape[1])
-        ):
-            break
-        cur_coords = cur_coords.astype(int)
-        cur_coords = cur_coords[
-            (cur_coords >= 0).all(axis=1)
-            & (cur_coords < tomo_shape).all(axis=1)
-        ]
-        volume[cur_coords[:, 0], cur_coords[:, 1], cur_coords[:, 2]] = True
-
-    for z in range(max_range):
-        cur_coords = mask_coords_3D + z * normal_vector
-        if (
-            all(cur_coords[:, 2] < 0)
-            or all(cur_coords[:, 2] >= tomo_shape[2])
-            or all(cur_coords[:, 0] < 0)
-            or all(cur_coords[:, 0] >= tomo_shape[0])
-            or all(cur_coords[:, 1] < 0)
-            or all(cur_coords[:, 1] >= tomo_shape[1])
-        ):
-            break
-        cur_coords = cur_coords.astype(int)
-        cur_coords = cur_coords[
-            (cur_coords >= 0).all(axis=1)
-            & (cur_coords < tomo_shape).all(axis=1)
-        ]
-        volume[cur_coords[:, 0], cur_coords[:, 1], cur_coords[:, 2]] = True
-    # volume1 = binary_closing(volume1)
-    if np.sum(volume) > 0:
-        volume = cropped_closing(volume)
+
+    # find the range of slices that can hit the tomogram
+    t_min, t_max = slab_intersection(
+        np.min(mask_coords_3D, axis=0),
+        np.max(mask_coords_3D, axis=0),
+        normal_vector,
+        tomo_shape,
+    )
+    bbox = prism_bounding_box(mask_coords_3D, normal_vector, tomo_shape)
+    if bbox is None:
+        start = stop = np.zeros(3, dtype=int)
+        z_range = range(0)
+    else:
+        start, stop = bbox
+        z_range = range(int(np.floor(t_min[0])), int(np.ceil(t_max[0])) + 1)
+
+    if conservative:
+        # padded by one voxel on every side, see supercover_voxels
+        padded_volume = np.zeros(stop - start + 2, dtype=bool)
+        volume = padded_volume[1:-1, 1:-1, 1:-1]
     else:
-        print("WARNING: No mask created. Check the polygon.")
-    return volume
+        volume = np.zeros(stop - start, dtype=bool)
+    with stage("Extending slices"):
+        for step, z in enumerate(z_range):
+            if progress_callback is not None:
+                progress_callback("Extending slices", step, len(z_range))
+            cur_coords = mask_coords_3D + z * normal_vector
+            if np.any(np.max(cur_coords, axis=0) < 0) or np.any(
+                np.min(cur_coords, axis=0) >= tomo_shape
+            ):
+                continue
+            if conservative:
+                flat_idcs = supercover_voxels(
+                    cur_coords - start, padded_volume.shape
+                )
+                padded_volume.reshape(-1)[flat_idcs] = True
+            else:
+                cur_coords = cur_coords.astype(int) - start
+                cur_coords = cur_coords[
+                    (cur_coords >= 0).all(axis=1)
+                    & (cur_coords < volume.shape).all(axis=1)
+                ]
+                volume[
+                    cur_coords[:, 0], cur_coords[:, 1], cur_coords[:, 2]
+                ] = True
+
+    if not volume.any():
+        warnings.warn("No mask created. Check the polygon.", stacklevel=2)
+    elif not conservative:
+        if progress_callback is not None:
+            progress_callback("Closing holes")
+        with stage("Closing holes"):
+            volume = cropped_closing(volume)
+    if crop:
+        return volume, start
+    return expand_to_full(volume, start, tomo_shape)
@@ -0,0 +1,287 @@
+"""
+Apply saved lassos to many tomograms without napari.
+
+For every MRC file in a directory, the lassos are combined into a mask, the
+tomogram is masked, its connected components are labelled and stored as
+separate MRC files. Tomograms are processed in parallel worker processes,
+each with an optional memory limit.
+
+Usage:
+    lasso-3d-batch polygons.json tomograms/ output/ --workers 8
+"""
+
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import mrcfile
+import numpy as np
+
+from lasso_3d import lasso_profiling
+from lasso_3d.lasso_components import (
+    component_table,
+    connected_components,
+    table_bounding_boxes,
+)
+from lasso_3d.lasso_composite import COMPOSITE_OPERATIONS, composite_masks
+from lasso_3d.lasso_engines import MASK_ENGINES
+from lasso_3d.lasso_io import (
+    store_component_table,
+    store_components,
+    store_mask,
+)
+from lasso_3d.lasso_labelling import CONNECTIVITIES
+from lasso_3d.lasso_masking import MASKING_MODES, mask_volume
+
+
+def load_polygons(filename):
+    """
+    Load lasso polygons from a JSON or CSV file.
+
+    JSON files contain a list of polygons (or an object with a "polygons"
+    list), each a list of vertices in (z, y, x) voxel coordinates, e.g. the
+    data of a napari points layer. CSV files have one vertex per row with
+    the columns polygon index, z, y and x (a header row is skipped).
+    """
+    if filename.lower().endswith(".json"):
+        with open(filename) as f:
+            polygons = json.load(f)
+        if isinstance(polygons, dict):
+            polygons = polygons["polygons"]
+        return [np.array(polygon, dtype=float) for polygon in polygons]
+
+    vertices = {}
+    with open(filename, newline="") as f:
+        for row in csv.reader(f):
+            try:
+                index, *coords = (float(value) for value in row)
+            except ValueError:
+                # header row
+                continue
+            vertices.setdefault(int(index), []).append(coords)
+    return [np.array(vertices[index]) for index in sorted(vertices)]
+
+
+def process_tomogram(
+    filename,
+    polygons,
+    output_dir,
+    operation="subtract",
+    engine="projection",
+    masking="isolate",
+    remove_small_objects_size=100,
+    perform_opening=False,
+    connectivity=6,
+    cropped=False,
+    n_workers=1,
+):
+    """
+    Mask a tomogram with the given lassos and store its components.
+
+    The first lasso is added to an empty mask, all following lassos are
+    combined with it using operation. The tomogram is memory-mapped. The
+    mask ("mask.mrc"), the connected components ("component_<i>.mrc") and
+    their statistics ("components.csv", see component_table) are written to
+    a folder named after the tomogram in output_dir.
+    Returns a short summary of the results.
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    with lasso_profiling.stage(f"Tomogram {name}"):
+        folder = os.path.join(output_dir, name)
+        os.makedirs(folder, exist_ok=True)
+
+        with mrcfile.mmap(filename, mode="r", permissive=True) as mrc:
+            volume = mrc.data
+            voxel_size = mrc.voxel_size.copy()
+            operations = ["union"] + [operation] * (len(polygons) - 1)
+            mask = composite_masks(
+                polygons, operations, volume.shape, engine=engine
+            )
+            masked_volume = mask_volume(volume, mask, masking)
+
+        store_mask(
+            os.path.join(folder, "mask.mrc"), mask, voxel_size=voxel_size
+        )
+        components, component_sizes = connected_components(
+            masked_volume,
+            remove_small_objects_size,
+            perform_opening,
+            connectivity=connectivity,
+            n_workers=n_workers,
+        )
+        table = component_table(
+            components, masked_volume, num_labels=len(component_sizes) - 1
+        )
+        store_component_table(os.path.join(folder, "components.csv"), table)
+        store_components(
+            components,
+            folder,
+            cropped=cropped,
+            n_workers=n_workers,
+            bounding_boxes=table_bounding_boxes(table),
+        )
+    return {
+        "tomogram": filename,
+        "output": folder,
+        "mask_voxels": int(np.count_nonzero(mask)),
+        "components": len(component_sizes) - 1,
+    }
+
+
+def _limit_memory(max_memory_gb):
+    """
+    Limit the address space of the current (worker) process.
+    """
+    if not max_memory_gb:
+        return
+    try:
+        import resource
+    except ImportError:
+        warnings.warn(
+            "Memory limits are not supported on this platform.", stacklevel=2
+        )
+        return
+    limit = int(max_memory_gb * 2**30)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def process_tomograms(
+    filenames,
+    polygons,
+    output_dir,
+    n_processes=1,
+    max_memory_gb=None,
+    **kwargs,
+):
+    """
+    Run process_tomogram for several tomograms in a process pool.
+
+    Every worker process is limited to max_memory_gb of address space, so a
+    tomogram exceeding it fails with a MemoryError instead of exhausting the
+    node. Failures are reported and do not stop the other tomograms.
+    Returns the summaries of the processed tomograms and the failures (file
+    name and error message).
+    """
+    results, failures = [], []
+    with ProcessPoolExecutor(
+        max_workers=n_processes,
+        initializer=_limit_memory,
+        initargs=(max_memory_gb,),
+    ) as executor:
+        futures = {
+            executor.submit(
+                process_tomogram, filename, polygons, output_dir, **kwargs
+            ): filename
+            for filename in filenames
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            filename = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:  # noqa: BLE001
+                failures.append((filename, repr(error)))
+                print(f"({done}/{len(futures)}) FAILED {filename}: {error!r}")
+                continue
+            results.append(result)
+            print(
+                f"({done}/{len(futures)}) {filename}: "
+                f"{result['components']} components"
+            )
+    return results, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("polygons", help="JSON or CSV file with the lassos.")
+    parser.add_argument("tomograms", help="Directory with MRC files.")
+    parser.add_argument("output", help="Output directory.")
+    parser.add_argument(
+        "--pattern", default="*.mrc", help="File pattern of the tomograms."
+    )
+    parser.add_argument(
+        "--operation",
+        choices=COMPOSITE_OPERATIONS,
+        default="subtract",
+        help="How lassos after the first one are combined.",
+    )
+    parser.add_argument(
+        "--engine", choices=list(MASK_ENGINES), default="projection"
+    )
+    parser.add_argument("--masking", choices=MASKING_MODES, default="isolate")
+    parser.add_argument(
+        "--remove-small-objects-size",
+        type=int,
+        default=100,
+        help="Remove components with fewer voxels.",
+    )
+    parser.add_argument("--perform-opening", action="store_true")
+    parser.add_argument(
+        "--connectivity",
+        type=int,
+        choices=list(CONNECTIVITIES),
+        default=6,
+        help="Number of neighbours a voxel is connected to.",
+    )
+    parser.add_argument(
+        "--cropped",
+        action="store_true",
+        help="Store components cropped to their bounding box.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of processes."
+    )
+    parser.add_argument(
+        "--max-memory-gb",
+        type=float,
+        help="Memory limit of every worker process.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log wall time and peak memory of every stage.",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Append the profiles as JSON lines to this file "
+        "(implies --profile).",
+    )
+    args = parser.parse_args(argv)
+
+    if args.profile or args.trace:
+        # also seen by worker processes that are not forked
+        os.environ[lasso_profiling.PROFILE_ENV] = "1"
+        if args.trace:
+            os.environ[lasso_profiling.TRACE_ENV] = args.trace
+        lasso_profiling.enable(args.trace)
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    polygons = load_polygons(args.polygons)
+    filenames = sorted(glob.glob(os.path.join(args.tomograms, args.pattern)))
+    if not polygons or not filenames:
+        parser.error("No polygons or no tomograms found.")
+
+    _, failures = process_tomograms(
+        filenames,
+        polygons,
+        args.output,
+        n_processes=args.workers,
+        max_memory_gb=args.max_memory_gb,
+        operation=args.operation,
+        engine=args.engine,
+        masking=args.masking,
+        remove_small_objects_size=args.remove_small_objects_size,
+        perform_opening=args.perform_opening,
+        connectivity=args.connectivity,
+        cropped=args.cropped,
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class MaskCache:
+    """
+    Least-recently-used cache of lasso masks.
+
+    Masks are stored cropped to their bounding box and bit-packed, so an
+    entry needs about one bit per voxel of the bounding box. Entries are
+    evicted (least recently used first) once the stored masks exceed
+    max_bytes.
+    """
+
+    def __init__(self, max_bytes=512 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(polygon_3d, tomo_shape, engine):
+        """
+        Key of a mask: hash of the polygon vertices, volume shape and engine.
+        """
+        vertices = np.ascontiguousarray(polygon_3d, dtype=float)
+        digest = hashlib.sha1(vertices.tobytes()).hexdigest()
+        return digest, vertices.shape, tuple(map(int, tomo_shape)), engine
+
+    def get(self, key):
+        """
+        Get the cropped mask and its offset, or None if it is not cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            packed, shape, offset = self._entries[key]
+        mask = np.unpackbits(packed, count=int(np.prod(shape)))
+        return mask.reshape(shape).view(bool), offset
+
+    def put(self, key, mask, offset):
+        """
+        Store a cropped mask and its offset, evicting old entries if needed.
+        """
+        packed = np.packbits(mask)
+        if packed.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[0].nbytes
+            self._entries[key] = (packed, mask.shape, np.array(offset))
+            self.nbytes += packed.nbytes
+            self._evict()
+
+    def resize(self, max_bytes):
+        """
+        Change the memory budget, evicting entries if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._entries:
+            packed = self._entries.popitem(last=False)[1][0]
+            self.nbytes -= packed.nbytes
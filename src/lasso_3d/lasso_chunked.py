@@ -0,0 +1,104 @@
+import itertools
+
+import numpy as np
+
+from lasso_3d.lasso_projection import (
+    create_projected_polygon_mask,
+    project_region,
+)
+from lasso_3d.lasso_utils import prism_bounding_box
+
+# dask.array is only imported by the functions that create lazy arrays, so
+# that importing this module (e.g. for is_lazy_array) stays fast
+
+
+def is_lazy_array(data):
+    """
+    Check whether an array is chunked and loaded lazily (e.g. dask, zarr).
+    """
+    return hasattr(data, "chunks") and not isinstance(data, np.ndarray)
+
+
+def as_dask_array(data, chunks="auto"):
+    """
+    Wrap an array as dask array, keeping its chunking if it has one.
+    """
+    import dask.array as da
+
+    if isinstance(data, da.Array):
+        return data
+    if is_lazy_array(data):
+        chunks = data.chunks
+    return da.from_array(data, chunks=chunks)
+
+
+def _block_misses_polygon(mask_2d, lower, rot_mat, start, stop):
+    """
+    Check whether the projection of a block onto the polygon plane lies
+    entirely outside the rasterized polygon.
+
+    The projection of the block is contained in the bounding box of its
+    projected corners, so this test never discards voxels of the prism.
+    """
+    corners = np.array(list(itertools.product(*zip(start, stop))), dtype=float)
+    corners_2d = np.dot(corners, rot_mat[:2].T) - lower
+    rows = np.flatnonzero(mask_2d.any(axis=1))
+    cols = np.flatnonzero(mask_2d.any(axis=0))
+    if rows.size == 0:
+        return True
+    return (
+        corners_2d[:, 0].max() < rows[0] - 1
+        or corners_2d[:, 0].min() > rows[-1] + 1
+        or corners_2d[:, 1].max() < cols[0] - 1
+        or corners_2d[:, 1].min() > cols[-1] + 1
+    )
+
+
+def lazy_mask_via_projection(polygon_3d, tomo_shape, chunks="auto"):
+    """
+    Create a lazy dask mask of the extruded polygon.
+
+    Each chunk is computed on demand with the projection engine. Chunks
+    outside the clipped prism are returned as zero blocks without
+    projecting any voxels.
+    """
+    import dask.array as da
+
+    mask_2d, lower, rot_mat = create_projected_polygon_mask(polygon_3d)
+    bbox = prism_bounding_box(polygon_3d, rot_mat[2], tomo_shape)
+    chunks = da.core.normalize_chunks(chunks, tuple(tomo_shape), dtype=bool)
+
+    def mask_block(block_info=None):
+        start, stop = zip(*block_info[None]["array-location"])
+        block_shape = tuple(b - a for a, b in zip(start, stop))
+        if (
+            bbox is None
+            or np.any(np.array(stop) <= bbox[0])
+            or np.any(np.array(start) >= bbox[1])
+            or _block_misses_polygon(mask_2d, lower, rot_mat, start, stop)
+        ):
+            return np.zeros(block_shape, dtype=bool)
+        return project_region(mask_2d, lower, rot_mat, start, stop)
+
+    return da.map_blocks(
+        mask_block, chunks=chunks, dtype=bool, meta=np.array((), dtype=bool)
+    )
+
+
+def lazy_mask_volume(volume, mask, masking):
+    """
+    Mask a volume lazily, chunk by chunk.
+
+    With masking "isolate", voxels outside the mask are set to zero, with
+    "subtract", voxels inside the mask are set to zero.
+    """
+    import dask.array as da
+
+    volume = as_dask_array(volume)
+    mask = as_dask_array(mask).rechunk(volume.chunks)
+    zero = volume.dtype.type(0)
+    if masking == "isolate":
+        return da.where(mask, volume, zero)
+    elif masking == "subtract":
+        return da.where(mask, zero, volume)
+    raise ValueError(f"Unknown masking mode '{masking}'.")
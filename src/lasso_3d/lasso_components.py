@@ -0,0 +1,216 @@
+from functools import partial
+
+import numpy as np
+from scipy.ndimage import find_objects
+
+from lasso_3d.lasso_labelling import label_in_chunks
+from lasso_3d.lasso_morphology import opening, padded_bounding_box
+from lasso_3d.lasso_packed import PackedMask
+from lasso_3d.lasso_profiling import stage
+from lasso_3d.lasso_utils import expand_to_full, label_dtype
+
+
+def remove_small_components(components, min_size):
+    """
+    Remove connected components smaller than min_size voxels.
+
+    The remaining components are relabeled consecutively, keeping their
+    order. Sizes are computed with a single bincount and the relabeling is
+    done with one lookup table, which also converts the labels to the
+    smallest sufficient unsigned integer dtype.
+
+    Returns the relabeled components and the component sizes, where entry i
+    is the number of voxels of (new) label i and entry 0 is the background.
+    """
+    sizes = np.bincount(components.ravel())
+    keep = sizes >= min_size
+    keep[0] = False
+
+    num_kept = np.count_nonzero(keep)
+    lookup = np.zeros(sizes.shape[0], dtype=label_dtype(num_kept))
+    lookup[keep] = np.arange(1, num_kept + 1)
+    components = lookup[components]
+
+    component_sizes = np.concatenate(
+        ([components.size - np.sum(sizes[keep])], sizes[keep])
+    )
+    return components, component_sizes
+
+
+def connected_components(
+    mask,
+    remove_small_objects_size=0,
+    perform_opening=False,
+    connectivity=6,
+    n_workers=4,
+    progress_callback=None,
+):
+    """
+    Label the connected components of a mask.
+
+    Optionally, a morphological opening is performed first to split objects
+    that touch in single voxels; it is computed only within the bounding
+    box of the mask (see lasso_morphology.opening). The mask is labelled in
+    chunks by n_workers threads (see lasso_labelling.label_in_chunks), voxels
+    are connected to their 6, 18 or 26 neighbours (connectivity). Components
+    smaller than remove_small_objects_size are removed.
+
+    Returns the labels and the component sizes (see remove_small_components).
+    A PackedMask is only unpacked inside the bounding box of its voxels.
+    """
+    if isinstance(mask, PackedMask):
+        # one voxel margin, so that the opening sees the empty surrounding
+        bounding_box = padded_bounding_box(mask, 1)
+        if bounding_box is None:
+            return np.zeros(mask.shape, dtype=np.uint8), np.array([mask.size])
+        start, stop = bounding_box
+        components, component_sizes = connected_components(
+            mask[tuple(slice(a, b) for a, b in zip(start, stop))],
+            remove_small_objects_size,
+            perform_opening,
+            connectivity=connectivity,
+            n_workers=n_workers,
+            progress_callback=progress_callback,
+        )
+        # voxels outside the bounding box are background
+        component_sizes[0] += mask.size - components.size
+        return (
+            expand_to_full(components, start, mask.shape),
+            component_sizes,
+        )
+
+    if perform_opening:
+        if progress_callback is not None:
+            progress_callback("Opening", 0, 3)
+        with stage("Opening"):
+            mask = opening(
+                np.asarray(mask) > 0,
+                n_workers=n_workers,
+                progress_callback=progress_callback,
+            )
+
+    # int32 labels, relabeled to the smallest sufficient unsigned dtype
+    # below; the mask is binarized chunk by chunk while labelling
+    if progress_callback is not None:
+        progress_callback("Labelling", 1, 3)
+    with stage("Labelling"):
+        components, _ = label_in_chunks(
+            mask,
+            connectivity,
+            n_workers=n_workers,
+            progress_callback=progress_callback,
+        )
+
+    if progress_callback is not None:
+        progress_callback("Removing small objects", 2, 3)
+    with stage("Removing small objects"):
+        return remove_small_components(components, remove_small_objects_size)
+
+
+@stage("Component table")
+def component_table(
+    components,
+    intensities=None,
+    num_labels=None,
+    max_block_voxels=2**22,
+    progress_callback=None,
+):
+    """
+    Statistics of all connected components, computed once per labelling.
+
+    The bounding boxes are found in a single find_objects pass; voxel
+    counts, centroids and (if intensities are given, e.g. the masked
+    volume) mean intensities are accumulated with bincounts in slabs along
+    the first axis. num_labels (the largest label) avoids an extra pass.
+
+    Returns a dict of arrays with one row per non-empty component: "label",
+    "size", "bbox_start" and "bbox_stop" (exclusive), "centroid" (z, y, x)
+    and "mean_intensity" (None without intensities).
+    """
+    if num_labels is None:
+        num_labels = int(components.max())
+    if progress_callback is not None:
+        progress_callback("Finding bounding boxes", 0, 2)
+    bounding_boxes = find_objects(components, max_label=num_labels)
+
+    sizes = np.zeros(num_labels + 1)
+    coordinate_sums = np.zeros((num_labels + 1, 3))
+    intensity_sums = np.zeros(num_labels + 1)
+    _, height, width = components.shape
+    slab_size = max(1, max_block_voxels // max(1, height * width))
+    y = np.repeat(np.arange(height), width)
+    x = np.tile(np.arange(width), height)
+    for z0 in range(0, components.shape[0], slab_size):
+        if progress_callback is not None:
+            progress_callback(
+                "Computing component statistics", z0, components.shape[0]
+            )
+        slab = np.asarray(components[z0 : z0 + slab_size])
+        depth = slab.shape[0]
+        labels = slab.ravel()
+        bincount = partial(np.bincount, labels, minlength=num_labels + 1)
+        sizes += bincount()
+        z = np.repeat(np.arange(z0, z0 + depth), y.size)
+        coordinate_sums[:, 0] += bincount(weights=z)
+        coordinate_sums[:, 1] += bincount(weights=np.tile(y, depth))
+        coordinate_sums[:, 2] += bincount(weights=np.tile(x, depth))
+        if intensities is not None:
+            values = np.asarray(intensities[z0 : z0 + depth], dtype=float)
+            intensity_sums += bincount(weights=values.ravel())
+
+    labels = np.flatnonzero(sizes[1:]) + 1
+    boxes = [bounding_boxes[label - 1] for label in labels]
+    table = {
+        "label": labels,
+        "size": sizes[labels].astype(np.int64),
+        "bbox_start": np.array(
+            [[axis.start for axis in box] for box in boxes], dtype=int
+        ).reshape(-1, 3),
+        "bbox_stop": np.array(
+            [[axis.stop for axis in box] for box in boxes], dtype=int
+        ).reshape(-1, 3),
+        "centroid": coordinate_sums[labels] / sizes[labels, None],
+        "mean_intensity": None,
+    }
+    if intensities is not None:
+        table["mean_intensity"] = intensity_sums[labels] / sizes[labels]
+    return table
+
+
+def table_bounding_boxes(table):
+    """
+    Bounding boxes of a component table in the format of find_objects, i.e.
+    a list of slice tuples where entry i belongs to label i + 1 (None for
+    labels without voxels).
+    """
+    num_labels = int(table["label"].max()) if len(table["label"]) else 0
+    bounding_boxes = [None] * num_labels
+    for label, start, stop in zip(
+        table["label"], table["bbox_start"], table["bbox_stop"]
+    ):
+        bounding_boxes[label - 1] = tuple(
+            slice(int(a), int(b)) for a, b in zip(start, stop)
+        )
+    return bounding_boxes
+
+
+def remove_components(components, table, labels):
+    """
+    Remove the given labels from the components in place.
+
+    Only the bounding box of every removed component is scanned. Labels of
+    the remaining components are kept. Returns the table without the rows
+    of the removed components.
+    """
+    remove = np.isin(table["label"], labels)
+    for start, stop, label in zip(
+        table["bbox_start"][remove],
+        table["bbox_stop"][remove],
+        table["label"][remove],
+    ):
+        region = components[tuple(slice(a, b) for a, b in zip(start, stop))]
+        region[region == label] = 0
+    return {
+        key: None if value is None else value[~remove]
+        for key, value in table.items()
+    }
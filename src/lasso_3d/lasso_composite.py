@@ -0,0 +1,71 @@
+import numpy as np
+
+from lasso_3d.lasso_engines import generate_mask, get_mask_engine
+from lasso_3d.lasso_masking import clear_outside
+
+COMPOSITE_OPERATIONS = ("union", "intersect", "subtract")
+
+
+def composite_masks(
+    polygons,
+    operations,
+    tomo_shape,
+    engine="projection",
+    mask=None,
+    cache=None,
+    progress_callback=None,
+):
+    """
+    Combine the masks of several lasso polygons into a single mask.
+
+    The operations ("union", "intersect", "subtract") are applied in order,
+    starting from an empty mask (or the given mask, which can also be a
+    PackedMask). Each polygon is only rasterized inside the bounding box of
+    its clipped prism and combined into the output in place, so no
+    full-size mask is created per polygon.
+    Masks found in the given MaskCache are reused.
+    """
+    if len(polygons) != len(operations):
+        raise ValueError("Number of polygons and operations must match.")
+    for operation in operations:
+        if operation not in COMPOSITE_OPERATIONS:
+            raise ValueError(
+                f"Unknown operation '{operation}'. "
+                f"Choose from {COMPOSITE_OPERATIONS}."
+            )
+
+    # fail early for unknown engines
+    get_mask_engine(engine)
+    if mask is None:
+        mask = np.zeros(tomo_shape, dtype=bool)
+
+    for idx, (polygon_3d, operation) in enumerate(zip(polygons, operations)):
+        polygon_callback = None
+        if progress_callback is not None:
+
+            def polygon_callback(stage, step=0, total=0, idx=idx):
+                progress_callback(
+                    f"Lasso {idx + 1}/{len(polygons)}: {stage}", step, total
+                )
+
+        mask_cropped, offset = generate_mask(
+            polygon_3d,
+            tomo_shape,
+            engine=engine,
+            crop=True,
+            cache=cache,
+            progress_callback=polygon_callback,
+        )
+        region = tuple(
+            slice(start, start + size)
+            for start, size in zip(offset, mask_cropped.shape)
+        )
+        if operation == "union":
+            mask[region] |= mask_cropped
+        elif operation == "subtract":
+            mask[region] &= ~mask_cropped
+        elif operation == "intersect":
+            mask[region] &= mask_cropped
+            clear_outside(mask, region)
+
+    return mask
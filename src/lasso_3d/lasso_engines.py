@@ -0,0 +1,97 @@
+from functools import partial
+
+import numpy as np
+
+from lasso_3d.lasso_add_slices import mask_via_extension
+from lasso_3d.lasso_profiling import stage
+from lasso_3d.lasso_projection import mask_via_projection
+from lasso_3d.lasso_rotate_vol import extend_polygon_to_3D_mask_voxels
+from lasso_3d.lasso_utils import expand_to_full
+
+# available engines to generate a 3D mask from a lasso polygon;
+# each engine takes the polygon vertices and the tomogram shape, and
+# optionally crop and progress_callback keyword arguments
+MASK_ENGINES = {
+    "projection": mask_via_projection,
+    "extension": mask_via_extension,
+    "supercover": partial(mask_via_extension, conservative=True),
+    "rotation": extend_polygon_to_3D_mask_voxels,
+}
+
+
+def get_mask_engine(engine):
+    """
+    Get the mask generation function registered under the given name.
+    """
+    if engine not in MASK_ENGINES:
+        raise ValueError(
+            f"Unknown mask engine '{engine}'. "
+            f"Choose from {list(MASK_ENGINES.keys())}."
+        )
+    return MASK_ENGINES[engine]
+
+
+def generate_mask(
+    polygon_3d,
+    tomo_shape,
+    engine="projection",
+    crop=False,
+    cache=None,
+    progress_callback=None,
+):
+    """
+    Generate the mask of a polygon with the given engine.
+
+    If a MaskCache is given, a cached mask of the same polygon, volume shape
+    and engine is reused, and newly generated masks are added to the cache.
+    """
+    key = None
+    cached = None
+    if cache is not None:
+        key = cache.make_key(polygon_3d, tomo_shape, engine)
+        cached = cache.get(key)
+
+    if cached is not None:
+        mask, offset = cached
+    else:
+        with stage(f"Mask ({engine})"):
+            mask, offset = get_mask_engine(engine)(
+                polygon_3d,
+                tomo_shape,
+                crop=True,
+                progress_callback=progress_callback,
+            )
+        if cache is not None:
+            cache.put(key, mask, offset)
+
+    if crop:
+        return mask, offset
+    with stage("Expanding mask"):
+        return expand_to_full(mask, offset, tomo_shape)
+
+
+def preview_mask(
+    polygon_3d,
+    tomo_shape,
+    binning=4,
+    engine="projection",
+    progress_callback=None,
+):
+    """
+    Generate a low-resolution mask of a polygon for previewing.
+
+    The mask is computed on a grid binned by binning voxels along every
+    axis, i.e. with about binning**3 fewer voxels. Binned voxel i covers
+    the full-resolution voxels binning * i to binning * (i + 1) - 1, so the
+    mask is aligned with the tomogram when displayed with a scale of
+    binning and a translation of (binning - 1) / 2 voxels.
+    """
+    binned_shape = tuple(-(-np.asarray(tomo_shape) // binning))
+    # voxel centers of the binned grid in binned coordinates
+    binned_polygon = (np.asarray(polygon_3d, dtype=float) + 0.5) / binning
+    return generate_mask(
+        binned_polygon - 0.5,
+        binned_shape,
+        engine=engine,
+        progress_callback=progress_callback,
+    )
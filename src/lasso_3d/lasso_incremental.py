@@ -0,0 +1,89 @@
+import numpy as np
+
+from lasso_3d.lasso_projection import (
+    create_projected_polygon_mask,
+    project_region,
+)
+from lasso_3d.lasso_utils import (
+    prism_bounding_box,
+    rotate_polygon_to_xy_plane,
+)
+
+
+def _polygon_rotation(polygon_3d):
+    _, _, rot_mat = rotate_polygon_to_xy_plane(
+        np.array(polygon_3d, dtype=float)
+    )
+    return rot_mat
+
+
+def changed_region(old_polygon, new_polygon, tomo_shape):
+    """
+    Bounding box of the region in which the projection masks of two
+    versions of a polygon can differ.
+
+    If vertices were moved within the plane of the polygon, the masks only
+    differ in the extrusion of the edges around the moved vertices. In all
+    other cases (changed plane or number of vertices), the bounding boxes of
+    both prisms are combined. Returns the start and (exclusive) stop indices,
+    or None if the masks are identical.
+    """
+    old_polygon = np.asarray(old_polygon, dtype=float)
+    new_polygon = np.asarray(new_polygon, dtype=float)
+    rot_mat = _polygon_rotation(new_polygon)
+
+    if old_polygon.shape == new_polygon.shape:
+        changed = np.flatnonzero((old_polygon != new_polygon).any(axis=1))
+        if changed.size == 0:
+            return None
+        if np.allclose(rot_mat, _polygon_rotation(old_polygon)):
+            # moved vertices together with their neighbours
+            num_vertices = new_polygon.shape[0]
+            affected = np.unique(
+                np.concatenate((changed - 1, changed, changed + 1))
+                % num_vertices
+            )
+            points = np.concatenate(
+                (old_polygon[affected], new_polygon[affected])
+            )
+            return prism_bounding_box(points, rot_mat[2], tomo_shape, margin=2)
+
+    boxes = [
+        prism_bounding_box(new_polygon, rot_mat[2], tomo_shape),
+        prism_bounding_box(
+            old_polygon, _polygon_rotation(old_polygon)[2], tomo_shape
+        ),
+    ]
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    start = np.min([box[0] for box in boxes], axis=0)
+    stop = np.max([box[1] for box in boxes], axis=0)
+    return start, stop
+
+
+def recompute_changed_region(
+    old_polygon, new_polygon, tomo_shape, progress_callback=None
+):
+    """
+    Recompute the projection mask of an edited polygon only where it can
+    differ from the mask of the previous polygon.
+
+    Returns the region slices and the new mask inside them, which can be
+    written into the existing mask, or None if nothing changed.
+    """
+    region = changed_region(old_polygon, new_polygon, tomo_shape)
+    if region is None:
+        return None
+    start, stop = region
+    mask_2d, lower, rot_mat = create_projected_polygon_mask(new_polygon)
+    patch = project_region(
+        mask_2d,
+        lower,
+        rot_mat,
+        start,
+        stop,
+        progress_callback=progress_callback,
+    )
+    slices = tuple(slice(a, b) for a, b in zip(start, stop))
+    return slices, patch
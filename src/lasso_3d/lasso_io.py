@@ -0,0 +1,171 @@
+import csv
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import mrcfile
+import numpy as np
+from scipy.ndimage import find_objects
+
+from lasso_3d.lasso_profiling import stage
+from lasso_3d.lasso_utils import shift_into
+
+logger = logging.getLogger(__name__)
+
+# MRC mode 0 (int8) is sufficient for binary masks
+MASK_DTYPE = np.int8
+
+# backends to store a single tomogram; membrain-seg is an optional dependency
+# and only imported when its backend is used
+STORE_BACKENDS = ("mrcfile", "membrain-seg")
+
+
+def store_mask(filename, mask, origin=None, voxel_size=None):
+    """
+    Store a binary mask as int8 MRC file.
+
+    The array axes are stored as they are, i.e. the first axis becomes the
+    MRC z-axis. If the mask is a crop of a larger volume, origin gives the
+    index of its first voxel, which is written to the nxstart, nystart and
+    nzstart header fields (and to the header origin if voxel_size is given).
+    """
+    with mrcfile.new(filename, overwrite=True) as out_mrc:
+        out_mrc.set_data(np.asarray(mask, dtype=MASK_DTYPE))
+        if voxel_size is not None:
+            out_mrc.voxel_size = voxel_size
+        if origin is not None:
+            out_mrc.header.nzstart = origin[0]
+            out_mrc.header.nystart = origin[1]
+            out_mrc.header.nxstart = origin[2]
+            if voxel_size is not None:
+                out_mrc.header.origin = tuple(
+                    np.array(origin[::-1], dtype=float) * voxel_size
+                )
+
+
+def store_mask_full(filename, mask, offset, tomo_shape, voxel_size=None):
+    """
+    Store a cropped mask as full-size int8 MRC file.
+
+    The file is written through a memory map, so only the cropped mask is
+    held in memory.
+    """
+    with mrcfile.new_mmap(
+        filename, shape=tuple(tomo_shape), mrc_mode=0, fill=0, overwrite=True
+    ) as out_mrc:
+        shift_into(mask, offset, out=out_mrc.data)
+        if voxel_size is not None:
+            out_mrc.voxel_size = voxel_size
+
+
+@stage("Storing tomogram")
+def store_tomogram(filename, data, backend="mrcfile"):
+    """
+    Store a binary volume as int8 MRC file with the given backend.
+
+    Both backends write the same file: "mrcfile" stores the array axes as
+    they are (see store_mask), membrain-seg's store_tomogram reverses the
+    axes, so the data is transposed before.
+    """
+    if backend == "mrcfile":
+        store_mask(filename, data)
+    elif backend == "membrain-seg":
+        try:
+            from membrain_seg.segmentation.dataloading.data_utils import (
+                store_tomogram as membrain_store_tomogram,
+            )
+        except ImportError as error:
+            raise ImportError(
+                "The membrain-seg backend requires membrain-seg "
+                "(pip install lasso-3d[membrain])."
+            ) from error
+        data = np.asarray(data, dtype=MASK_DTYPE)
+        membrain_store_tomogram(filename, np.transpose(data, (2, 1, 0)))
+    else:
+        raise ValueError(
+            f"Unknown store backend '{backend}'. "
+            f"Choose from {STORE_BACKENDS}."
+        )
+
+
+@stage("Storing components")
+def store_components(
+    components,
+    foldername,
+    cropped=False,
+    n_workers=4,
+    bounding_boxes=None,
+    progress_callback=None,
+):
+    """
+    Store every connected component as a separate int8 MRC file.
+
+    The bounding boxes of all components are found in a single pass (or
+    given as bounding_boxes in the format of find_objects, e.g. from a
+    component table) and each component is only extracted from its
+    bounding box. With cropped,
+    the files contain only the bounding box (with its origin in the header),
+    otherwise they are written as full-size volumes. Files are written
+    concurrently by n_workers threads; progress_callback(stage, step, total)
+    is called after each stored component.
+    """
+    if bounding_boxes is None:
+        bounding_boxes = find_objects(components)
+    labels = [
+        label
+        for label, bounding_box in enumerate(bounding_boxes, start=1)
+        if bounding_box is not None
+    ]
+
+    def store(label):
+        bounding_box = bounding_boxes[label - 1]
+        component = components[bounding_box] == label
+        offset = [axis_slice.start for axis_slice in bounding_box]
+        filename = os.path.join(str(foldername), f"component_{label}.mrc")
+        if cropped:
+            store_mask(filename, component, origin=offset)
+        else:
+            store_mask_full(filename, component, offset, components.shape)
+        return label
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(store, label) for label in labels]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                label = future.result()
+                logger.debug(
+                    "Stored component %d (%d/%d)", label, done, len(labels)
+                )
+                if progress_callback is not None:
+                    progress_callback("Storing components", done, len(labels))
+        except BaseException:
+            # do not start writing the remaining components
+            for future in futures:
+                future.cancel()
+            raise
+
+
+@stage("Storing component table")
+def store_component_table(filename, table):
+    """
+    Store a component table (see lasso_components.component_table) as CSV
+    file with one row per component.
+    """
+    columns = ["label", "size"]
+    columns += [f"bbox_start_{axis}" for axis in "zyx"]
+    columns += [f"bbox_stop_{axis}" for axis in "zyx"]
+    columns += [f"centroid_{axis}" for axis in "zyx"]
+    rows = [
+        table["label"],
+        table["size"],
+        *table["bbox_start"].T,
+        *table["bbox_stop"].T,
+        *table["centroid"].T,
+    ]
+    if table["mean_intensity"] is not None:
+        columns.append("mean_intensity")
+        rows.append(table["mean_intensity"])
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*(row.tolist() for row in rows)))
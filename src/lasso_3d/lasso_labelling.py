@@ -0,0 +1,148 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.ndimage import generate_binary_structure, label
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components as graph_components
+
+# rank of the structuring element for each voxel connectivity
+CONNECTIVITIES = {6: 1, 18: 2, 26: 3}
+
+
+def _run_concurrently(func, items, n_workers, stage, progress_callback):
+    """
+    Call func for all items in n_workers threads and return the results in
+    the order of the items.
+    """
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(func, item) for item in items]
+        try:
+            results = []
+            for done, future in enumerate(futures, start=1):
+                results.append(future.result())
+                if progress_callback is not None:
+                    progress_callback(stage, done, len(futures))
+        except BaseException:
+            # do not start processing the remaining items
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def _face_pairs(labels_before, labels_after, structure):
+    """
+    Pairs of labels that touch across the face between two planes.
+
+    The in-plane offsets of the neighbours in the next plane are given by
+    the last plane of the structuring element.
+    """
+    pairs = []
+    height, width = labels_before.shape
+    for dy, dx in np.argwhere(structure[2]) - 1:
+        before = labels_before[
+            max(0, -dy) : height - max(0, dy), max(0, -dx) : width - max(0, dx)
+        ]
+        after = labels_after[
+            max(0, dy) : height - max(0, -dy), max(0, dx) : width - max(0, -dx)
+        ]
+        touching = (before > 0) & (after > 0)
+        pairs.append(np.stack((before[touching], after[touching]), axis=1))
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def label_in_chunks(
+    mask,
+    connectivity=6,
+    chunk_size=64,
+    n_workers=4,
+    out=None,
+    progress_callback=None,
+):
+    """
+    Label the connected components of a mask chunk by chunk.
+
+    The mask is split into slabs of chunk_size planes along the first axis,
+    which are binarized and labelled concurrently by n_workers threads.
+    Labels of components touching across the faces between slabs are then
+    merged (as connected components of the graph of touching labels, i.e. a
+    union-find) and all labels are replaced by consecutive final labels in
+    the same order as scipy.ndimage.label of the whole mask.
+
+    The mask can be any array that supports slicing, e.g. a memory map or a
+    dask array; only the slabs that are processed are loaded. The labels are
+    written to out (a new int32 array by default, can also be a memory map).
+    Returns the labels and the number of components.
+
+    Splitting only pays off with several threads: in-memory masks are
+    labelled as a whole if at most one thread (or CPU) is available.
+    """
+    if connectivity not in CONNECTIVITIES:
+        raise ValueError(
+            f"Unknown connectivity {connectivity}. "
+            f"Choose from {list(CONNECTIVITIES)}."
+        )
+    structure = generate_binary_structure(3, CONNECTIVITIES[connectivity])
+    if out is None:
+        out = np.zeros(mask.shape, dtype=np.int32)
+    n_workers = min(n_workers, os.cpu_count() or 1)
+    if n_workers <= 1 and type(mask) is np.ndarray:
+        if progress_callback is not None:
+            progress_callback("Labelling", 0, 1)
+        # label counts all non-zero voxels, the slabs only positive ones
+        binary = mask if mask.dtype == bool else mask > 0
+        return out, label(binary, structure, output=out)
+    slabs = [
+        slice(z0, min(z0 + chunk_size, mask.shape[0]))
+        for z0 in range(0, mask.shape[0], chunk_size)
+    ]
+
+    # label every slab separately
+    def label_slab(slab):
+        return label(np.asarray(mask[slab]) > 0, structure, output=out[slab])
+
+    counts = _run_concurrently(
+        label_slab, slabs, n_workers, "Labelling chunks", progress_callback
+    )
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    num_labels = int(offsets[-1])
+    if num_labels > np.iinfo(out.dtype).max:
+        raise ValueError(f"Too many components for labels of {out.dtype}.")
+
+    # merge labels that touch across slab faces
+    if progress_callback is not None:
+        progress_callback("Merging chunks")
+    pairs = [np.zeros((0, 2), dtype=np.int64)]
+    for idx in range(1, len(slabs)):
+        face = slabs[idx].start
+        before = out[face - 1].astype(np.int64)
+        after = out[face].astype(np.int64)
+        before[before > 0] += offsets[idx - 1]
+        after[after > 0] += offsets[idx]
+        pairs.append(_face_pairs(before, after, structure))
+    pairs = np.concatenate(pairs) - 1
+    graph = coo_matrix(
+        (np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])),
+        shape=(num_labels, num_labels),
+    )
+    # components are numbered in order of their smallest label
+    num_components, final_labels = graph_components(graph, directed=False)
+    lookup = np.concatenate(([0], final_labels + 1)).astype(out.dtype)
+
+    # replace the slab labels by the final labels
+    def relabel_slab(idx):
+        slab = slabs[idx]
+        slab_lookup = np.concatenate(
+            ([0], lookup[offsets[idx] + 1 : offsets[idx + 1] + 1])
+        )
+        out[slab] = slab_lookup[out[slab]]
+
+    _run_concurrently(
+        relabel_slab,
+        range(len(slabs)),
+        n_workers,
+        "Relabelling chunks",
+        progress_callback,
+    )
+    return out, num_components
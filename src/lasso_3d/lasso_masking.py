@@ -0,0 +1,103 @@
+import numpy as np
+
+from lasso_3d.lasso_profiling import stage
+
+MASKING_MODES = ("isolate", "subtract")
+
+
+def mask_bounding_box(mask):
+    """
+    Start and (exclusive) stop indices of the nonzero voxels of a mask, or
+    None if the mask is empty.
+
+    The mask is reduced with `any` along one axis at a time, each time only
+    within the range already found for the previous axes.
+    """
+    if hasattr(mask, "bounding_box"):
+        return mask.bounding_box()
+    start, stop = [], []
+    region = mask
+    for axis in range(mask.ndim):
+        other_axes = tuple(i for i in range(mask.ndim) if i != axis)
+        occupied = np.flatnonzero(region.any(axis=other_axes))
+        if occupied.size == 0:
+            return None
+        start.append(occupied[0])
+        stop.append(occupied[-1] + 1)
+        crop = (slice(None),) * axis + (slice(start[-1], stop[-1]),)
+        region = region[crop]
+    return np.array(start), np.array(stop)
+
+
+def clear_outside(volume, region):
+    """
+    Set all voxels outside of a box region to zero, one slab per side.
+    """
+    for axis, axis_slice in enumerate(region):
+        # the remaining sides only need to be cleared inside the previous
+        # axis ranges
+        inside = tuple(region[:axis])
+        volume[inside + (slice(None, axis_slice.start),)] = 0
+        volume[inside + (slice(axis_slice.stop, None),)] = 0
+
+
+@stage("Masking volume")
+def mask_volume(
+    volume,
+    mask,
+    masking,
+    in_place=False,
+    max_block_voxels=2**24,
+    progress_callback=None,
+):
+    """
+    Mask a volume, only processing the bounding box of the mask.
+
+    With masking "isolate", voxels outside the mask are set to zero, with
+    "subtract", voxels inside the mask are set to zero. The mask is applied
+    in slabs within its bounding box, so temporaries are at most slab-sized.
+    If in_place, the volume itself is modified. Otherwise, "subtract" masks a
+    copy of the volume and "isolate" only copies the masked voxels into a
+    zero volume. The mask can also be a PackedMask.
+    """
+    if masking not in MASKING_MODES:
+        raise ValueError(f"Unknown masking mode '{masking}'.")
+
+    if progress_callback is not None:
+        progress_callback("Finding mask bounding box")
+    bounding_box = mask_bounding_box(mask)
+    if in_place:
+        out = volume
+    elif masking == "isolate":
+        out = np.zeros(volume.shape, dtype=volume.dtype)
+    else:
+        if progress_callback is not None:
+            progress_callback("Copying volume")
+        out = np.array(volume, copy=True)
+
+    if bounding_box is None:
+        if masking == "isolate" and in_place:
+            out[...] = 0
+        return out
+    start, stop = bounding_box
+    region = tuple(slice(a, b) for a, b in zip(start, stop))
+    if masking == "isolate" and in_place:
+        clear_outside(out, region)
+
+    zero = out.dtype.type(0)
+    slab_voxels = max(1, int(np.prod(stop[1:] - start[1:])))
+    slab_size = max(1, max_block_voxels // slab_voxels)
+    for z0 in range(start[0], stop[0], slab_size):
+        if progress_callback is not None:
+            progress_callback(
+                "Masking volume", z0 - start[0], stop[0] - start[0]
+            )
+        slab = (slice(z0, min(z0 + slab_size, stop[0])),) + region[1:]
+        mask_slab = np.asarray(mask[slab], dtype=bool)
+        if masking == "subtract":
+            np.copyto(out[slab], zero, where=mask_slab)
+        elif in_place:
+            np.copyto(out[slab], zero, where=~mask_slab)
+        else:
+            np.copyto(out[slab], volume[slab], where=mask_slab)
+    return out
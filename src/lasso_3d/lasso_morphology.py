@@ -0,0 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
+from scipy.ndimage import (
+    binary_closing,
+    binary_dilation,
+    binary_erosion,
+    generate_binary_structure,
+)
+
+from lasso_3d.lasso_masking import mask_bounding_box
+
+# 6-connected structuring element, the default of scipy and skimage
+STRUCTURE = generate_binary_structure(3, 1)
+
+
+def padded_bounding_box(mask, padding):
+    """
+    Bounding box of the nonzero voxels of a mask, padded by padding voxels
+    on every side and clipped to the mask. Returns the start and (exclusive)
+    stop indices, or None if the mask is empty.
+    """
+    bounding_box = mask_bounding_box(mask)
+    if bounding_box is None:
+        return None
+    start = np.maximum(bounding_box[0] - padding, 0)
+    stop = np.minimum(bounding_box[1] + padding, mask.shape)
+    return start, stop
+
+
+def _opening(volume, iterations=1):
+    # same border handling as skimage.morphology.binary_opening
+    eroded = binary_erosion(
+        volume, STRUCTURE, iterations=iterations, border_value=1
+    )
+    return binary_dilation(eroded, STRUCTURE, iterations=iterations)
+
+
+def _apply_in_slabs(
+    func,
+    mask,
+    start,
+    stop,
+    halo,
+    slab_size=64,
+    n_workers=4,
+    stage="Morphology",
+    progress_callback=None,
+):
+    """
+    Apply a morphological operation to a box of a mask in slabs along the
+    first axis, processed concurrently by n_workers threads.
+
+    Every slab is extended by halo voxels on both sides (within the box), so
+    the result equals applying func to the whole box if the operation only
+    depends on voxels within halo. Returns the result for the box.
+    """
+    out = np.zeros(tuple(stop - start), dtype=bool)
+    in_plane = tuple(slice(a, b) for a, b in zip(start[1:], stop[1:]))
+
+    def process(z0):
+        z1 = min(z0 + slab_size, stop[0])
+        halo_start = max(z0 - halo, start[0])
+        halo_stop = min(z1 + halo, stop[0])
+        slab = mask[(slice(halo_start, halo_stop),) + in_plane]
+        result = func(np.asarray(slab, dtype=bool))
+        out[z0 - start[0] : z1 - start[0]] = result[
+            z0 - halo_start : z1 - halo_start
+        ]
+
+    slab_starts = range(start[0], stop[0], slab_size)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(process, z0) for z0 in slab_starts]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if progress_callback is not None:
+                    progress_callback(stage, done, len(futures))
+        except BaseException:
+            # do not start processing the remaining slabs
+            for future in futures:
+                future.cancel()
+            raise
+    return out
+
+
+def closing(
+    mask,
+    iterations=1,
+    out=None,
+    slab_size=64,
+    n_workers=4,
+    progress_callback=None,
+):
+    """
+    Binary closing of a mask, computed only within its bounding box.
+
+    The bounding box is padded by the reach of the dilation, so the result
+    equals scipy.ndimage.binary_closing of the whole mask (6-connected
+    structuring element). The box is processed in slabs with a halo. If out
+    is given (e.g. the mask itself), the result is written into it.
+    """
+    box = padded_bounding_box(mask, iterations)
+    if out is None:
+        out = np.zeros(mask.shape, dtype=bool)
+    if box is None:
+        return out
+    start, stop = box
+    result = _apply_in_slabs(
+        partial(binary_closing, structure=STRUCTURE, iterations=iterations),
+        mask,
+        start,
+        stop,
+        halo=2 * iterations,
+        slab_size=slab_size,
+        n_workers=n_workers,
+        stage="Closing",
+        progress_callback=progress_callback,
+    )
+    out[tuple(slice(a, b) for a, b in zip(start, stop))] = result
+    return out
+
+
+def opening(
+    mask,
+    iterations=1,
+    out=None,
+    slab_size=64,
+    n_workers=4,
+    progress_callback=None,
+):
+    """
+    Binary opening of a mask, computed only within its bounding box.
+
+    The result equals skimage.morphology.binary_opening of the whole mask
+    (6-connected structuring element). The bounding box is processed in
+    slabs with a halo. If out is given (e.g. the mask itself), the result is
+    written into it.
+    """
+    box = padded_bounding_box(mask, iterations)
+    if out is None:
+        out = np.zeros(mask.shape, dtype=bool)
+    if box is None:
+        return out
+    start, stop = box
+    result = _apply_in_slabs(
+        partial(_opening, iterations=iterations),
+        mask,
+        start,
+        stop,
+        halo=2 * iterations,
+        slab_size=slab_size,
+        n_workers=n_workers,
+        stage="Opening",
+        progress_callback=progress_callback,
+    )
+    out[tuple(slice(a, b) for a, b in zip(start, stop))] = result
+    return out
@@ -0,0 +1,146 @@
+import numpy as np
+
+# number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)])
+
+
+class PackedMask:
+    """
+    Binary volume stored with one bit per voxel.
+
+    Every row along the last axis is bit-packed, so a mask needs an eighth
+    of the memory of a bool array. The mask behaves like a read-only bool
+    array for napari: indexing only unpacks the requested rows. Union
+    (|), intersection (&) and negation (~) work directly on the packed bits.
+    Regions can be overwritten by assigning dense bool arrays.
+    """
+
+    dtype = np.dtype(bool)
+
+    def __init__(self, packed, shape):
+        self.packed = packed
+        self.shape = tuple(int(size) for size in shape)
+
+    @classmethod
+    def from_dense(cls, mask):
+        mask = np.asarray(mask, dtype=bool)
+        return cls(np.packbits(mask, axis=-1), mask.shape)
+
+    @classmethod
+    def zeros(cls, shape):
+        shape = tuple(shape)
+        row_bytes = -(-shape[-1] // 8)
+        return cls(np.zeros(shape[:-1] + (row_bytes,), dtype=np.uint8), shape)
+
+    def copy(self):
+        return PackedMask(self.packed.copy(), self.shape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"PackedMask(shape={self.shape}, nbytes={self.nbytes})"
+
+    def _normalize_key(self, key):
+        """
+        Expand an index to one entry per axis.
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        for idx, entry in enumerate(key):
+            if entry is Ellipsis:
+                fill = (slice(None),) * (self.ndim - len(key) + 1)
+                key = key[:idx] + fill + key[idx + 1 :]
+                break
+        return key + (slice(None),) * (self.ndim - len(key))
+
+    def __getitem__(self, key):
+        key = self._normalize_key(key)
+        rows = self.packed[key[:-1]]
+        dense = np.unpackbits(rows, axis=-1, count=self.shape[-1])
+        return dense.view(bool)[(Ellipsis, key[-1])]
+
+    def __setitem__(self, key, value):
+        key = self._normalize_key(key)
+        dense = self[key[:-1]]
+        dense[(Ellipsis, key[-1])] = value
+        self.packed[key[:-1]] = np.packbits(dense, axis=-1)
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self[...]
+        if dtype is not None:
+            return dense.astype(dtype)
+        return dense
+
+    def _packed_operand(self, other):
+        if not isinstance(other, PackedMask):
+            other = PackedMask.from_dense(other)
+        if other.shape != self.shape:
+            raise ValueError(
+                f"Shapes {self.shape} and {other.shape} do not match."
+            )
+        return other.packed
+
+    def __or__(self, other):
+        return PackedMask(
+            self.packed | self._packed_operand(other), self.shape
+        )
+
+    def __and__(self, other):
+        return PackedMask(
+            self.packed & self._packed_operand(other), self.shape
+        )
+
+    def __ior__(self, other):
+        self.packed |= self._packed_operand(other)
+        return self
+
+    def __iand__(self, other):
+        self.packed &= self._packed_operand(other)
+        return self
+
+    def __invert__(self):
+        inverted = ~self.packed
+        # keep the padding bits of the last byte of every row unset
+        padding = (-self.shape[-1]) % 8
+        inverted[..., -1] &= np.uint8((0xFF << padding) & 0xFF)
+        return PackedMask(inverted, self.shape)
+
+    def count_nonzero(self):
+        return int(_POPCOUNT[self.packed].sum())
+
+    def any(self):
+        return bool(self.packed.any())
+
+    def bounding_box(self):
+        """
+        Start and (exclusive) stop indices of the set voxels, or None if the
+        mask is empty. Only the packed rows are reduced.
+        """
+        if not self.any():
+            return None
+        start, stop = [], []
+        for axis in range(self.ndim - 1):
+            other_axes = tuple(i for i in range(self.packed.ndim) if i != axis)
+            occupied = np.flatnonzero(self.packed.any(axis=other_axes))
+            start.append(occupied[0])
+            stop.append(occupied[-1] + 1)
+        columns = np.bitwise_or.reduce(
+            self.packed.reshape(-1, self.packed.shape[-1]), axis=0
+        )
+        occupied = np.flatnonzero(np.unpackbits(columns, count=self.shape[-1]))
+        start.append(occupied[0])
+        stop.append(occupied[-1] + 1)
+        return np.array(start), np.array(stop)
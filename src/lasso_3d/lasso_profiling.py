@@ -0,0 +1,165 @@
+"""
+Wall time and peak memory of the stages of the lasso pipeline.
+
+Profiling is switched on with the environment variable LASSO_3D_PROFILE=1
+(or enable(), e.g. from the widget). If LASSO_3D_PROFILE_TRACE is set to a
+file name, every profiled operation is appended to it as one line of JSON,
+so traces of many sessions can be aggregated. Records are also logged to
+the "lasso_3d.lasso_profiling" logger.
+
+Memory is measured with tracemalloc (which also tracks numpy arrays) as the
+peak of allocations during a stage relative to its start. The peak is
+process-wide, so it is only measured for the operation that started first;
+operations running concurrently in other threads only record wall times.
+Allocations of other threads during a measured stage are included.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILE_ENV = "LASSO_3D_PROFILE"
+TRACE_ENV = "LASSO_3D_PROFILE_TRACE"
+
+logger = logging.getLogger(__name__)
+
+_settings = {
+    "enabled": os.environ.get(PROFILE_ENV, "0") not in ("", "0"),
+    "trace_file": os.environ.get(TRACE_ENV) or None,
+}
+_trace_lock = threading.Lock()
+# held by the thread whose stages measure memory peaks, see stage
+_peak_lock = threading.Lock()
+# open stages of every thread
+_local = threading.local()
+
+
+def enable(trace_file=None):
+    """
+    Switch on profiling, optionally appending traces to trace_file.
+    """
+    _settings["enabled"] = True
+    if trace_file is not None:
+        _settings["trace_file"] = str(trace_file)
+
+
+def disable():
+    """
+    Switch off profiling. Tracing memory is stopped once no stage is open.
+    """
+    _settings["enabled"] = False
+    if _local.__dict__.get("stack") or not _peak_lock.acquire(blocking=False):
+        # stopped when the open stages are left
+        return
+    try:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+    finally:
+        _peak_lock.release()
+
+
+def is_enabled():
+    return _settings["enabled"]
+
+
+@contextmanager
+def stage(name):
+    """
+    Profile the enclosed code as a stage of the pipeline.
+
+    Stages can be nested; yields the list of records of this stage and its
+    sub-stages (depth-first, filled when the stage is left). Each record has
+    the stage name, its depth, the wall time in seconds and the peak memory
+    in MB. When an outermost stage is left, its records are logged and
+    written to the trace file. Does nothing if profiling is disabled.
+
+    Peaks are measured by resetting the process-wide tracemalloc peak, which
+    only one thread can do at a time: stages of other threads opened in the
+    meantime only record their wall time (peak None) and never wait.
+    """
+    records = []
+    if not _settings["enabled"]:
+        yield records
+        return
+
+    stack = _local.__dict__.setdefault("stack", [])
+    if stack:
+        tracked = stack[-1]["tracked"]
+    else:
+        tracked = _peak_lock.acquire(blocking=False)
+    entry = {"tracked": tracked, "records": records}
+    if tracked:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        memory, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # keep the peak of the enclosing stage before resetting it
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        entry.update(memory=memory, peak=memory)
+    stack.append(entry)
+    start = time.perf_counter()
+    try:
+        yield records
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        peak_mb = None
+        if tracked:
+            peak = max(entry["peak"], tracemalloc.get_traced_memory()[1])
+            peak_mb = (peak - entry["memory"]) / 2**20
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        records.insert(
+            0,
+            {
+                "stage": name,
+                "depth": len(stack),
+                "seconds": seconds,
+                "peak_mb": peak_mb,
+            },
+        )
+        if stack:
+            stack[-1]["records"].extend(records)
+        else:
+            if tracked:
+                if not _settings["enabled"]:
+                    # profiling was disabled while the stages were open
+                    tracemalloc.stop()
+                _peak_lock.release()
+            report(records)
+
+
+def summary(records):
+    """
+    One line per record, indented by the depth of the stage.
+    """
+    lines = []
+    for record in records:
+        line = f"{'  ' * record['depth']}{record['stage']}: "
+        line += f"{record['seconds']:.2f} s"
+        if record["peak_mb"] is not None:
+            line += f", {record['peak_mb']:.1f} MB peak"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def report(records):
+    """
+    Log the records of an operation and append them to the trace file.
+    """
+    if not records:
+        return
+    logger.info("Profile of %s:\n%s", records[0]["stage"], summary(records))
+    trace_file = _settings["trace_file"]
+    if trace_file is None:
+        return
+    line = json.dumps(
+        {"time": time.time(), "pid": os.getpid(), "records": records}
+    )
+    with _trace_lock, open(trace_file, "a") as f:
+        f.write(line + "\n")
@@ -0,0 +1,153 @@
+import warnings
+
+import numpy as np
+from skimage.draw import polygon2mask
+
+from lasso_3d.lasso_utils import (
+    expand_to_full,
+    prism_bounding_box,
+    rotate_polygon_to_xy_plane,
+)
+
+# padding (in pixels) around the rasterized 2D polygon; border pixels are
+# always outside the polygon, so out-of-range lookups can be clipped onto them
+MASK_2D_PADDING = 2
+
+
+def create_projected_polygon_mask(polygon_3d, upsampling=4):
+    """
+    Rasterize a 3D polygon in the coordinate frame of its own plane.
+
+    The pixel grid is anchored to integer in-plane coordinates, so the
+    rasterization does not depend on the position of the polygon center.
+    Each voxel unit is split into upsampling pixels along both in-plane axes
+    to keep the point-in-polygon lookup close to exact.
+
+    Returns the 2D mask, the in-plane coordinate of its pixel (0, 0) and the
+    rotation matrix mapping tomogram coordinates into the polygon frame, with
+    the first two rows scaled to pixel units.
+    """
+    polygon_3d = np.asarray(polygon_3d, dtype=float)
+    _, _, rot_mat = rotate_polygon_to_xy_plane(polygon_3d.copy())
+    polygon_2d = np.dot(polygon_3d, rot_mat.T)[:, :2]
+
+    lower = np.floor(np.min(polygon_2d, axis=0)) - MASK_2D_PADDING
+    upper = np.ceil(np.max(polygon_2d, axis=0)) + MASK_2D_PADDING
+    mask_shape = ((upper - lower) * upsampling + 1).astype(int)
+    mask_2d = polygon2mask(mask_shape, (polygon_2d - lower) * upsampling)
+
+    rot_mat = rot_mat.copy()
+    rot_mat[:2] *= upsampling
+    return mask_2d, lower * upsampling, rot_mat
+
+
+def project_region(
+    mask_2d,
+    lower,
+    rot_mat,
+    start,
+    stop,
+    out=None,
+    max_block_voxels=2**20,
+    progress_callback=None,
+):
+    """
+    Evaluate the extruded polygon for all voxels in a box of the tomogram.
+
+    Every voxel center in [start, stop) is projected onto the polygon plane
+    and looked up in the rasterized 2D polygon. The box is processed in slabs
+    along the first axis so that temporaries stay below max_block_voxels.
+    progress_callback(stage, step, total) is called before each slab.
+    """
+    start = np.asarray(start, dtype=int)
+    stop = np.asarray(stop, dtype=int)
+    region_shape = tuple(stop - start)
+    if out is None:
+        out = np.zeros(region_shape, dtype=bool)
+    if 0 in region_shape:
+        return out
+
+    axes = [np.arange(start[i], stop[i], dtype=np.float32) for i in range(3)]
+    rot = rot_mat[:2].astype(np.float32)
+    # in-plane coordinates are separable: u = u_x(x) + u_yz(y, z)
+    u_x = rot[0, 0] * axes[0] - np.float32(lower[0])
+    v_x = rot[1, 0] * axes[0] - np.float32(lower[1])
+    u_yz = rot[0, 1] * axes[1][:, None] + rot[0, 2] * axes[2]
+    v_yz = rot[1, 1] * axes[1][:, None] + rot[1, 2] * axes[2]
+
+    # shift by 0.5 so that truncation rounds to the nearest pixel
+    u_x += 0.5
+    v_x += 0.5
+    max_u = np.float32(mask_2d.shape[0] - 1)
+    max_v = np.float32(mask_2d.shape[1] - 1)
+    flat_mask = mask_2d.ravel()
+    slab_size = max(1, max_block_voxels // u_yz.size)
+    num_slabs = -(-region_shape[0] // slab_size)
+    # buffers reused for all slabs, so that the temporaries stay at about
+    # 12 bytes per voxel of a slab
+    slab_shape = (min(slab_size, region_shape[0]),) + u_yz.shape
+    u_buffer = np.empty(slab_shape, dtype=np.float32)
+    v_buffer = np.empty(slab_shape, dtype=np.float32)
+    idx_buffer = np.empty(slab_shape, dtype=np.int32)
+    for x0 in range(0, region_shape[0], slab_size):
+        if progress_callback is not None:
+            progress_callback("Projecting voxels", x0 // slab_size, num_slabs)
+        x1 = min(x0 + slab_size, region_shape[0])
+        u, v, idx = (
+            buffer[: x1 - x0] for buffer in (u_buffer, v_buffer, idx_buffer)
+        )
+        np.add(u_x[x0:x1, None, None], u_yz, out=u)
+        np.add(v_x[x0:x1, None, None], v_yz, out=v)
+        np.clip(u, 0, max_u, out=u)
+        np.clip(v, 0, max_v, out=v)
+        # truncate to pixel indices; the buffer of u is reused for those of v
+        np.copyto(idx, u, casting="unsafe")
+        idx *= mask_2d.shape[1]
+        v_idx = u.view(np.int32)
+        np.copyto(v_idx, v, casting="unsafe")
+        idx += v_idx
+        np.take(flat_mask, idx, out=out[x0:x1])
+    return out
+
+
+def mask_via_projection(
+    polygon_3d, tomo_shape, crop=False, progress_callback=None
+):
+    """
+    Create a mask by projecting every voxel onto the polygon plane.
+
+    Steps:
+    1. Rotate the polygon to the xy plane and create a 2D pixel mask.
+    2. Clip the polygon extruded along its normal to the tomogram.
+    3. Project all voxel coordinates inside the clipped bounding box onto
+       the polygon plane using the same rotation.
+    4. Check which projections lie inside the 2D pixel mask.
+
+    Since every voxel is tested exactly once, the resulting prism has no
+    holes and no closing pass is needed.
+
+    If crop is True, only the bounding box of the clipped prism is returned,
+    together with its offset in the tomogram.
+    """
+    mask_2d, lower, rot_mat = create_projected_polygon_mask(polygon_3d)
+    normal_vector = rot_mat[2]
+
+    bbox = prism_bounding_box(polygon_3d, normal_vector, tomo_shape)
+    if bbox is None:
+        start = stop = np.zeros(3, dtype=int)
+    else:
+        start, stop = bbox
+    volume = project_region(
+        mask_2d,
+        lower,
+        rot_mat,
+        start,
+        stop,
+        progress_callback=progress_callback,
+    )
+
+    if not volume.any():
+        warnings.warn("No mask created. Check the polygon.", stacklevel=2)
+    if crop:
+        return volume, start
+    return expand_to_full(volume, start, tomo_shape)
@@ -1,9 +1,12 @@
+import warnings
+
 import numpy as np
 from scipy.ndimage import affine_transform
 from skimage.draw import polygon2mask
 
 from lasso_3d.lasso_utils import (
-    roll_or_concat,
+    expand_to_full,
+    prism_bounding_box,
     rotate_polygon_to_xy_plane,
 )
 
@@ -23,63 +26,71 @@ def create_2D_mask_from_polygon(polygon_2d):
     return mask, -min_val + 5
 
 
-def extend_2D_mask_to_3D_volume(mask, tomo_shape):
-    """
-    Extend a 2D mask to a 3D volume by repeating it along the z-axis.
-    """
-    volume = np.zeros(
-        (mask.shape[0], mask.shape[1], max(tomo_shape)), dtype=int
-    )
-    for z in range(volume.shape[2]):
-        volume[:, :, z] = mask
-    return volume
-
-
-def calculate_offset(volume, rot_mat):
-    center = np.array(volume.shape) / 2
-    offset = -center + np.dot(rot_mat, center)
-    return offset
-
-
-def extend_polygon_to_3D_mask_voxels(polygon_3d, tomo_shape):
+def extend_polygon_to_3D_mask_voxels(
+    polygon_3d,
+    tomo_shape,
+    crop=False,
+    max_block_voxels=2**22,
+    progress_callback=None,
+):
     """
-    Create a 3D volume from a 3D polygon by extending it along the z-axis.
+    Create a 3D volume from a 3D polygon by extending it along its normal.
 
     How it works:
     1. Rotate the polygon to the xy plane.
     2. Create a 2D mask of the rotated polygon.
-    3. Create a 3D volume from the 2D mask by extending it along the z-axis.
-    4. Rotate the 3D volume back to the original orientation.
-
+    3. Rotate the voxels of the output volume into the frame of the 2D mask
+       with a single affine transform. The 2D mask is used as a volume with
+       one z-slice, so that the nearest boundary mode extends it infinitely
+       along z.
+
+    The output is only computed inside the bounding box of the extruded
+    polygon (clipped to the tomogram), in slabs along the first axis. If crop
+    is True, this cropped mask is returned together with its offset in the
+    tomogram.
     """
 
     # rotate the polygon to the xy plane
+    polygon_3d = np.array(polygon_3d, dtype=float)
     polygon_3d_rotated, polygon_center, rot_mat = rotate_polygon_to_xy_plane(
-        polygon_3d
+        polygon_3d.copy()
     )
 
     # create a 2D mask of the rotated polygon
     polygon_2d = polygon_3d_rotated[:, :2]
-    mask, _ = create_2D_mask_from_polygon(polygon_2d, tomo_shape)
-
-    # create a 3D volume from the 2D mask by stacking it along the z-axis
-    volume = extend_2D_mask_to_3D_volume(mask, tomo_shape)
-
-    # rotate the volume
-    offset = calculate_offset(volume, rot_mat)
-    volume_rotated = affine_transform(volume, rot_mat, order=0, offset=-offset)
-
-    # roll the volume to the original position
-    polygon_shift = np.array(volume_rotated.shape) // 2 - polygon_center
-    polygon_shift *= -1
-
-    volume_rotated = roll_or_concat(volume_rotated, int(polygon_shift[0]), 0)
-    volume_rotated = roll_or_concat(volume_rotated, int(polygon_shift[1]), 1)
-    volume_rotated = roll_or_concat(volume_rotated, int(polygon_shift[2]), 2)
-
-    # crop to tomo size
-    volume_rotated = volume_rotated[
-        : tomo_shape[0], : tomo_shape[1], : tomo_shape[2]
-    ]
-
-    return volume_rotated
+    mask_2d, shift = create_2D_mask_from_polygon(polygon_2d.copy())
+    mask_2d = mask_2d.astype(np.uint8)[:, :, np.newaxis]
+
+    # only compute voxels of the extruded polygon inside the tomogram
+    bbox = prism_bounding_box(polygon_3d, rot_mat[2], tomo_shape)
+    if bbox is None:
+        start = stop = np.zeros(3, dtype=int)
+    else:
+        start, stop = bbox
+    volume = np.zeros(stop - start, dtype=np.uint8)
+
+    # voxel x maps to rot_mat @ (x - polygon_center) + shift in the 2D mask
+    mask_shift = np.array([shift, shift, 0])
+    slab_size = max(1, max_block_voxels // max(1, np.prod(volume.shape[1:])))
+    num_slabs = -(-volume.shape[0] // slab_size)
+    for x0 in range(0, volume.shape[0], slab_size):
+        if progress_callback is not None:
+            progress_callback("Rotating mask", x0 // slab_size, num_slabs)
+        slab = volume[x0 : x0 + slab_size]
+        slab_start = start + np.array([x0, 0, 0])
+        offset = np.dot(rot_mat, slab_start - polygon_center) + mask_shift
+        affine_transform(
+            mask_2d,
+            rot_mat,
+            offset=offset,
+            output=slab,
+            order=0,
+            mode="nearest",
+        )
+
+    volume = volume.view(bool)
+    if not volume.any():
+        warnings.warn("No mask created. Check the polygon.", stacklevel=2)
+    if crop:
+        return volume, start
+    return expand_to_full(volume, start, tomo_shape)
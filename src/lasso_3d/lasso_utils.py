@@ -1,6 +1,13 @@
 import numpy as np
 
 
+def label_dtype(max_label):
+    """
+    Get the smallest unsigned integer dtype that can hold max_label.
+    """
+    return np.min_scalar_type(max(int(max_label), 0))
+
+
 def generate_random_polygon(n_vertices=5, tomo_shape=(100, 100, 100)):
     # create a polygon layer, where all vertices lie on the same plane
     polygon_x = np.random.randint(0, tomo_shape[0], n_vertices)
@@ -138,79 +145,103 @@ def shift_polygon(polygon_2d, max_shape):
     return polygon_2d, shift_array
 
 
+def _segment_distances(points, start, end):
+    """
+    Distances of points to the line segment from start to end.
+    """
+    segment = end - start
+    length_sq = np.dot(segment, segment)
+    if length_sq == 0:
+        return np.linalg.norm(points - start, axis=1)
+    t = np.clip(np.dot(points - start, segment) / length_sq, 0, 1)
+    return np.linalg.norm(
+        points - (start + t[:, np.newaxis] * segment), axis=1
+    )
+
+
+def _simplify_polyline(points, tolerance):
+    """
+    Ramer-Douglas-Peucker simplification of an open polyline. Returns a mask
+    of the vertices to keep.
+    """
+    keep = np.zeros(points.shape[0], dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, points.shape[0] - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(
+            points[first + 1 : last], points[first], points[last]
+        )
+        farthest = np.argmax(distances)
+        if distances[farthest] > tolerance:
+            farthest += first + 1
+            keep[farthest] = True
+            stack += [(first, farthest), (farthest, last)]
+    return keep
+
+
+def simplify_polygon(polygon, tolerance=1.0):
+    """
+    Simplify a closed polygon with the Ramer-Douglas-Peucker algorithm.
+
+    Vertices are removed as long as the simplified outline deviates at most
+    tolerance (in voxels) from the original one. The polygon is split at the
+    vertex farthest from the first vertex and both halves are simplified
+    separately. The polygon is returned unchanged for a tolerance of 0 or if
+    it would collapse to fewer than 3 vertices.
+    """
+    polygon = np.asarray(polygon)
+    if tolerance <= 0 or polygon.shape[0] < 4:
+        return polygon
+    split = np.argmax(np.linalg.norm(polygon - polygon[0], axis=1))
+    closed = np.concatenate((polygon, polygon[:1]))
+    keep = np.zeros(polygon.shape[0], dtype=bool)
+    keep[: split + 1] = _simplify_polyline(closed[: split + 1], tolerance)
+    keep[split:] |= _simplify_polyline(closed[split:], tolerance)[:-1]
+    if np.count_nonzero(keep) < 3:
+        return polygon
+    return polygon[keep]
+
+
+def shift_into(volume, offset, out_shape=None, out=None):
+    """
+    Place a volume shifted by offset (per axis) into an output volume.
+
+    Only the window where both volumes overlap is copied, parts shifted
+    outside of the output are dropped. If out is given (e.g. a preallocated
+    or memory-mapped array), the window is written into it and all other
+    voxels are left untouched. Otherwise, a zero volume of out_shape
+    (default: the shape of volume) and the dtype of volume is created.
+    """
+    if out is None:
+        if out_shape is None:
+            out_shape = volume.shape
+        out = np.zeros(out_shape, dtype=volume.dtype)
+
+    src_window = []
+    dst_window = []
+    for shift, src_size, dst_size in zip(offset, volume.shape, out.shape):
+        shift = int(shift)
+        dst_start = max(shift, 0)
+        dst_stop = min(shift + src_size, dst_size)
+        if dst_stop <= dst_start:
+            return out
+        src_window.append(slice(dst_start - shift, dst_stop - shift))
+        dst_window.append(slice(dst_start, dst_stop))
+    out[tuple(dst_window)] = volume[tuple(src_window)]
+    return out
+
+
 def roll_or_concat(volume, roll_idcs, dimension):
-    if roll_idcs < 0:
-        if dimension == 0:
-            volume = np.concatenate(
-                (np.zeros((abs(roll_idcs),) + volume.shape[1:]), volume),
-                axis=dimension,
-            )
-        elif dimension == 1:
-            volume = np.concatenate(
-                (
-                    np.zeros(
-                        (
-                            volume.shape[0],
-                            abs(roll_idcs),
-                        )
-                        + volume.shape[2:]
-                    ),
-                    volume,
-                ),
-                axis=dimension,
-            )
-        elif dimension == 2:
-            volume = np.concatenate(
-                (
-                    np.zeros(
-                        (volume.shape[0], volume.shape[1], abs(roll_idcs))
-                    ),
-                    volume,
-                ),
-                axis=dimension,
-            )
-        volume = np.roll(volume, roll_idcs, axis=dimension)
-        if dimension == 0:
-            volume = volume[abs(roll_idcs) :, :, :]
-        elif dimension == 1:
-            volume = volume[:, abs(roll_idcs) :, :]
-        elif dimension == 2:
-            volume = volume[:, :, abs(roll_idcs) :]
-    else:
-        if dimension == 0:
-            volume = np.concatenate(
-                (volume, np.zeros((roll_idcs,) + volume.shape[1:])),
-                axis=dimension,
-            )
-            volume = np.roll(volume, roll_idcs, axis=dimension)
-            volume = volume[:-roll_idcs, :, :]
-        elif dimension == 1:
-            volume = np.concatenate(
-                (
-                    volume,
-                    np.zeros(
-                        (
-                            volume.shape[0],
-                            roll_idcs,
-                        )
-                        + volume.shape[2:]
-                    ),
-                ),
-                axis=dimension,
-            )
-            volume = np.roll(volume, roll_idcs, axis=dimension)
-            volume = volume[:, :-roll_idcs, :]
-        elif dimension == 2:
-            volume = np.concatenate(
-                (
-                    volume,
-                    np.zeros((volume.shape[0], volume.shape[1], roll_idcs)),
-                ),
-                axis=dimension,
-            )
-            volume = np.roll(volume, roll_idcs, axis=dimension)
-            volume = volume[:, :, :-roll_idcs]
-    return volume
+    """
+    Shift a volume by roll_idcs along an axis, filling with zeros instead of
+    wrapping around.
+    """
+    offset = np.zeros(volume.ndim, dtype=int)
+    offset[dimension] = roll_idcs
+    return shift_into(volume, offset)
 
 
 def convert_voxelgrid_to_array(voxel_grid):
@@ -235,44 +266,110 @@ def convert_voxelgrid_to_array(voxel_grid):
     return voxel_array
 
 
-def find_polygon_distances(polygon_3d, tomo_shape, normal_vector):
-    # find first point along normal vector s.t. all shifted points are outside the tomo shape
+def slab_intersection(lower, upper, direction, tomo_shape):
+    """
+    Compute the range of t for which a box moved along direction overlaps
+    the tomogram.
+
+    The moving box spans [lower + t * direction, upper + t * direction] and
+    the tomogram spans [0, tomo_shape). Rows of lower and upper are
+    processed independently. Empty intersections have t_min > t_max.
+    """
+    lower = np.atleast_2d(np.asarray(lower, dtype=float))
+    upper = np.atleast_2d(np.asarray(upper, dtype=float))
+    t_min = np.full(lower.shape[0], -np.inf)
+    t_max = np.full(lower.shape[0], np.inf)
+    for axis in range(3):
+        d = direction[axis]
+        if np.isclose(d, 0):
+            outside = (upper[:, axis] < 0) | (
+                lower[:, axis] >= tomo_shape[axis]
+            )
+            t_min[outside] = np.inf
+            t_max[outside] = -np.inf
+            continue
+        t_enter = (0 - upper[:, axis]) / d
+        t_exit = (tomo_shape[axis] - lower[:, axis]) / d
+        if d < 0:
+            t_enter, t_exit = t_exit, t_enter
+        t_min = np.maximum(t_min, t_enter)
+        t_max = np.minimum(t_max, t_exit)
+    return t_min, t_max
+
+
+def ray_box_intersection(origins, direction, tomo_shape):
+    """
+    Slab test of rays origin + t * direction against the tomogram box.
+
+    Returns for each origin the range [t_min, t_max] inside the tomogram.
+    """
+    return slab_intersection(origins, origins, direction, tomo_shape)
+
 
-    t = 0
-    while True:
-        x_comps = polygon_3d[:, 0] + t * normal_vector[0]
-        y_comps = polygon_3d[:, 1] + t * normal_vector[1]
-        z_comps = polygon_3d[:, 2] + t * normal_vector[2]
+def prism_bounding_box(points, normal_vector, tomo_shape, margin=1):
+    """
+    Axis-aligned bounding box of the points extruded along the normal,
+    clipped to the tomogram.
+
+    The extrusion is limited to the range of t in which the bounding box
+    of the points can still overlap the tomogram. Returns the start and
+    (exclusive) stop indices, or None if the prism misses the tomogram.
+    """
+    points = np.asarray(points, dtype=float)
+    t_min, t_max = slab_intersection(
+        np.min(points, axis=0),
+        np.max(points, axis=0),
+        normal_vector,
+        tomo_shape,
+    )
+    t_min, t_max = t_min[0], t_max[0]
+    if t_min > t_max:
+        return None
+
+    extruded = np.concatenate(
+        (points + t_min * normal_vector, points + t_max * normal_vector),
+        axis=0,
+    )
+    start = np.floor(np.min(extruded, axis=0)).astype(int) - margin
+    stop = np.ceil(np.max(extruded, axis=0)).astype(int) + margin + 1
+    start = np.clip(start, 0, tomo_shape)
+    stop = np.clip(stop, 0, tomo_shape)
+    if np.any(stop <= start):
+        return None
+    return start, stop
 
-        x_masks = (x_comps < 0) | (x_comps >= tomo_shape[0])
-        y_masks = (y_comps < 0) | (y_comps >= tomo_shape[1])
-        z_masks = (z_comps < 0) | (z_comps >= tomo_shape[2])
 
-        sample_mask = x_masks | y_masks | z_masks
-        if sample_mask.all():
-            break
+def expand_to_full(mask, offset, tomo_shape, out=None):
+    """
+    Insert a cropped mask at the given offset into a full-size volume.
 
-        t += 1
-    t_forward = t
+    If out is given, the mask is written into it instead of a new volume.
+    """
+    return shift_into(mask, offset, out_shape=tomo_shape, out=out)
 
-    t = 0
-    while True:
-        x_comps = polygon_3d[:, 0] + t * normal_vector[0]
-        y_comps = polygon_3d[:, 1] + t * normal_vector[1]
-        z_comps = polygon_3d[:, 2] + t * normal_vector[2]
 
-        x_masks = (x_comps < 0) | (x_comps >= tomo_shape[0])
-        y_masks = (y_comps < 0) | (y_comps >= tomo_shape[1])
-        z_masks = (z_comps < 0) | (z_comps >= tomo_shape[2])
+def find_polygon_distances(polygon_3d, tomo_shape, normal_vector):
+    """
+    Find the first integer shifts along the normal vector (forwards and
+    backwards) for which all polygon vertices are outside the tomo shape.
+    """
+    t_enter, t_exit = ray_box_intersection(
+        polygon_3d, normal_vector, tomo_shape
+    )
+    hit = t_enter <= t_exit
+    t_enter, t_exit = t_enter[hit], t_exit[hit]
 
-        sample_mask = x_masks | y_masks | z_masks
-        if sample_mask.all():
-            break
+    def is_outside(t):
+        coords = polygon_3d + t * normal_vector
+        return ((coords < 0) | (coords >= tomo_shape)).any(axis=1).all()
 
-        t -= 1
-    t_backward = t
+    # the first shift outside the tomogram lies just behind a ray exit
+    forward = np.concatenate(([0], np.floor(t_exit), np.floor(t_exit) + 1))
+    t_forward = min(t for t in forward if t >= 0 and is_outside(t))
+    backward = np.concatenate(([0], np.ceil(t_enter), np.ceil(t_enter) - 1))
+    t_backward = max(t for t in backward if t <= 0 and is_outside(t))
 
-    return t_forward, t_backward
+    return int(t_forward), int(t_backward)
 
 
 # def create_volume_from_polygon_mesh(polygon_3d, tomo_shape):